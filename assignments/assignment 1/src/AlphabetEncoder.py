@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+# The letters of the model, '_' standing for word boundaries.
+# A letter is identified everywhere by its index in this string.
+ALPHABET = "abcdefghijklmnopqrstuvwxyz_"
+
+
+class AlphabetEncoder:
+    """
+    Cleans and encodes a text in a single pass: the text is lowered,
+    a space becomes two underscores, any other character out of the alphabet
+    is dropped, and each remaining letter is replaced by its index in the alphabet.
+    """
+
+    def __init__(self, alphabet=ALPHABET):
+        """
+        Creates the translation tables of an alphabet.
+        :param alphabet: the letters to keep, '_' standing for spaces.
+        """
+        self.alphabet = alphabet
+        # For each byte of a lowered UTF-8 text: its code and the number of times it is kept.
+        # Bytes of non-ASCII characters (>= 128) are always dropped.
+        self.codes = np.zeros(256, dtype=np.uint8)
+        self.repeats = np.zeros(256, dtype=np.intp)
+        for i, letter in enumerate(alphabet):
+            self.codes[ord(letter)] = i
+            self.repeats[ord(letter)] = 1
+        self.codes[ord(" ")] = alphabet.index("_")
+        self.repeats[ord(" ")] = 2
+        self.letters = np.frombuffer(alphabet.encode("ascii"), dtype=np.uint8)
+
+    def encode(self, text, boundaries=False):
+        """
+        Cleans and encodes a text.
+        As each character is cleaned on its own, a text can be encoded piece by piece.
+        :param text: the text to encode
+        :param boundaries: True to mark the beginning and the end of the text with '_'.
+        :return: the uint8 array of the indexes of the letters in the alphabet
+        """
+        if boundaries:
+            text = "_" + text + "_"
+        data = np.frombuffer(text.lower().encode("utf-8"), dtype=np.uint8)
+        return np.repeat(self.codes[data], self.repeats[data])
+
+    def encode_lines(self, texts):
+        """
+        Cleans and encodes several texts at once, each one marked with '_' at its beginning and end.
+        :param texts: the texts to encode
+        :return: the codes of all the texts put end to end, and the number of codes of each text.
+        """
+        encoded_texts = [("_" + text + "_").lower().encode("utf-8") for text in texts]
+        data = np.frombuffer(b"".join(encoded_texts), dtype=np.uint8)
+        repeats = self.repeats[data]
+        # Each text holds at least its two underscores, hence a last byte.
+        last_bytes = np.cumsum(np.fromiter(map(len, encoded_texts), dtype=np.intp, count=len(encoded_texts))) - 1
+        ends = np.cumsum(repeats)[last_bytes]
+        return np.repeat(self.codes[data], repeats), np.diff(ends, prepend=0)
+
+    def decode(self, codes):
+        """
+        Gives back the (cleaned) text of an array of codes.
+        :param codes: the indexes of the letters in the alphabet
+        """
+        return self.letters[codes].tobytes().decode("ascii")
+
+    def count(self, codes):
+        """
+        Counts each letter of an encoded text.
+        :param codes: the encoded text
+        :return: the number of occurrences of each letter of the alphabet
+        """
+        return np.bincount(codes, minlength=len(self.alphabet))
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+import json
+import struct
+
+import numpy as np
+
+# Binary files (models, count snapshots): a magic string, the version (uint16)
+# and the length of the JSON header (uint32), the header, then the little-endian
+# arrays listed in the header, each one aligned on 64 bytes.
+PREFIX_FORMAT = "<HI"
+ALIGNMENT = 64
+
+
+def write_binary_file(path, magic, version, header, arrays):
+    """
+    Writes a header and some arrays in a binary file.
+    :param path: Path to the file.
+    :param magic: the bytes identifying the kind of file
+    :param version: the version of the format
+    :param header: the JSON-serializable metadatas, the list of the arrays is added to them.
+    :param arrays: the (name, little-endian dtype, array) of each array.
+    """
+    header = dict(header, arrays=[[name, dtype, list(np.shape(array))] for name, dtype, array in arrays])
+    header = json.dumps(header).encode("utf-8")
+    header += b" " * (-(len(magic) + struct.calcsize(PREFIX_FORMAT) + len(header)) % ALIGNMENT)
+    with open(path, 'wb') as file:
+        file.write(magic)
+        file.write(struct.pack(PREFIX_FORMAT, version, len(header)))
+        file.write(header)
+        for name, dtype, array in arrays:
+            data = np.ascontiguousarray(array, dtype=dtype).tobytes()
+            file.write(data + b"\0" * (-len(data) % ALIGNMENT))
+
+
+def read_binary_header(path, magic, kind):
+    """
+    Reads the header of a binary file.
+    :param path: Path to the file.
+    :param magic: the bytes identifying the kind of file
+    :param kind: the kind of file, for the error messages
+    :return: the version of the format, the header, and the offset of the first array.
+    """
+    with open(path, 'rb') as file:
+        if file.read(len(magic)) != magic:
+            raise ValueError("Not a " + kind + " file: ", path)
+        version, header_length = struct.unpack(PREFIX_FORMAT, file.read(struct.calcsize(PREFIX_FORMAT)))
+        header = json.loads(file.read(header_length).decode("utf-8"))
+    return version, header, len(magic) + struct.calcsize(PREFIX_FORMAT) + header_length
+
+
+def map_arrays(path, arrays, offset, aligned=True):
+    """
+    Memory-maps the arrays of a binary file, which are only read when used.
+    :param path: Path to the file.
+    :param arrays: the [name, dtype, shape] of each array, in order.
+    :param offset: the offset of the first array.
+    :param aligned: False for files whose arrays are not aligned.
+    :return: the arrays, by name.
+    """
+    mapped = {}
+    for name, dtype, shape in arrays:
+        if np.prod(shape) == 0:
+            # An empty array cannot be mapped
+            mapped[name] = np.zeros(shape, dtype=dtype)
+            continue
+        mapped[name] = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=tuple(shape))
+        offset += mapped[name].nbytes
+        if aligned:
+            offset += -mapped[name].nbytes % ALIGNMENT
+    return mapped
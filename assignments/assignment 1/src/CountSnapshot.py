@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from AlphabetEncoder import ALPHABET
+from BinaryFormat import map_arrays, read_binary_header, write_binary_file
+from LanguageModel import LanguageModel, ENCODER, merge_counts, ANSI
+from SparseNgramTable import SparseNgramTable
+
+# Count snapshot file: SNAPSHOT_MAGIC, then the header and arrays as laid out by BinaryFormat:
+# the letter counts (uint64), then the n-gram counts (uint32), either the dense matrix
+# or the identifiers (int64) and counts of the n-grams seen.
+SNAPSHOT_MAGIC = b"CHARCT"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_EXTENSION = "__counts.bin"
+
+
+class CountSnapshot:
+    """
+    The raw counts of a language model (letters and n-grams), from which
+    a model can be smoothed again, or rebuilt after adding or removing
+    the counts of other texts, without reading the corpus again.
+    """
+
+    def __init__(self, name, order, letters_count, trigrams_count):
+        """
+        :param name: the name of the model
+        :param order: Number of letters of the n-grams.
+        :param letters_count: the number of occurrences of each letter of the alphabet
+        :param trigrams_count: the n-gram counts, cf. LanguageModel.trigrams_count
+        """
+        self.name = name
+        self.order = order
+        self.letters_count = letters_count
+        self.trigrams_count = trigrams_count
+
+    @property
+    def dense(self):
+        return not isinstance(self.trigrams_count, SparseNgramTable)
+
+    @classmethod
+    def from_model(cls, lm):
+        """
+        Takes the raw counts of a trained language model.
+        :param lm: the language model, whose n-grams are counted
+        """
+        if lm.trigrams_count is None:
+            raise ValueError("The raw counts of the model are not available: ", lm.name)
+        letters_count = np.array([lm.vocabulary.get(letter, 0) for letter in ALPHABET], dtype=np.uint64)
+        return cls(lm.name, lm.order, letters_count, lm.trigrams_count)
+
+    @classmethod
+    def from_text(cls, text, order=3, name=""):
+        """
+        Counts a text, e.g. to add it to (or remove it from) another snapshot.
+        :param text: the text to count
+        :param order: Number of letters of the n-grams.
+        :param name: the name of the snapshot
+        """
+        codes = ENCODER.encode(text, boundaries=True)
+        return cls(name, order, ENCODER.count(codes).astype(np.uint64), LanguageModel.count_ngrams(codes, order))
+
+    def save(self, path):
+        """
+        Saves the counts in the count snapshot format.
+        :param path: Path to the snapshot file.
+        """
+        arrays = [("letters_count", "<u8", self.letters_count)]
+        if self.dense:
+            arrays.append(("trigrams_count", "<u4", self.trigrams_count))
+        else:
+            arrays += [("ngram_keys", "<i8", self.trigrams_count.keys),
+                       ("trigrams_count", "<u4", self.trigrams_count.values)]
+        header = {"name": self.name, "alphabet": ALPHABET, "order": self.order, "dense": self.dense}
+        write_binary_file(path, SNAPSHOT_MAGIC, SNAPSHOT_VERSION, header, arrays)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a snapshot saved by save(). The counts are memory-mapped, hence only read when used.
+        :param path: Path to the snapshot file.
+        """
+        version, header, offset = read_binary_header(path, SNAPSHOT_MAGIC, "count snapshot")
+        if version != SNAPSHOT_VERSION:
+            raise ValueError("Unsupported count snapshot version: ", version)
+        if header["alphabet"] != ALPHABET:
+            raise ValueError("Unsupported alphabet: ", header["alphabet"])
+        arrays = map_arrays(path, header["arrays"], offset)
+        trigrams_count = arrays["trigrams_count"]
+        if not header["dense"]:
+            trigrams_count = SparseNgramTable(arrays["ngram_keys"], trigrams_count)
+        return cls(header["name"], header["order"], arrays["letters_count"], trigrams_count)
+
+    @classmethod
+    def merge(cls, snapshots, name=None):
+        """
+        Sums the counts of several snapshots of the same order.
+        :param snapshots: the snapshots to sum
+        :param name: the name of the merged snapshot (the one of the first snapshot by default)
+        """
+        snapshots = list(snapshots)
+        order = snapshots[0].order
+        if any(snapshot.order != order for snapshot in snapshots):
+            raise ValueError("The snapshots must all have the same order")
+        letters_count = np.sum([snapshot.letters_count for snapshot in snapshots], axis=0, dtype=np.uint64)
+        trigrams_count = merge_counts(snapshot.trigrams_count for snapshot in snapshots)
+        return cls(snapshots[0].name if name is None else name, order, letters_count, trigrams_count)
+
+    def __add__(self, other):
+        return CountSnapshot.merge([self, other])
+
+    def __sub__(self, other):
+        """
+        Removes the counts of another snapshot (e.g. of a text counted by mistake).
+        """
+        if other.order != self.order:
+            raise ValueError("The snapshots must have the same order")
+        if (self.letters_count < other.letters_count).any():
+            raise ValueError("Cannot remove more letters than counted: ", other.name)
+        letters_count = self.letters_count - other.letters_count
+        if not self.dense:
+            trigrams_count = self.trigrams_count.subtract(other.trigrams_count)
+        elif (self.trigrams_count < other.trigrams_count).any():
+            raise ValueError("Cannot remove more n-grams than counted: ", other.name)
+        else:
+            trigrams_count = self.trigrams_count - other.trigrams_count
+        return CountSnapshot(self.name, self.order, letters_count, trigrams_count)
+
+    def to_model(self, smoothing=None, path_file=None):
+        """
+        Builds a normalised language model from the counts, without reading any corpus.
+        :param smoothing: the smoothing of the model (cf. Smoothing.py), none by default
+        :param path_file: the path the model is exported to (the name of the snapshot by default)
+        :return: the language model, ready to score texts.
+        """
+        print(ANSI.header, "Building", self.name, "from its counts", ANSI.endc)
+        lm = LanguageModel(self.name if path_file is None else path_file, read_corpus=False, order=self.order)
+        lm.name = self.name
+        lm.vocabulary = {ALPHABET[i]: int(count) for i, count in enumerate(self.letters_count) if count > 0}
+        # Copied out of the snapshot file, so that the model can be updated.
+        if self.dense:
+            lm.trigrams_count = np.array(self.trigrams_count)
+        else:
+            lm.trigrams_count = SparseNgramTable(np.array(self.trigrams_count.keys),
+                                                 np.array(self.trigrams_count.values))
+        if smoothing is not None:
+            lm.set_smoothing(smoothing)
+        lm.maximum_likelihood()
+        return lm
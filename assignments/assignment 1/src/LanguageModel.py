@@ -1,44 +1,170 @@
 # -*- coding: utf-8 -*-
 
+import codecs
 import os
-import random
-import re as regexp
 import json
+from collections import namedtuple
 from decimal import Decimal
-from operator import itemgetter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from AlphabetEncoder import AlphabetEncoder, ALPHABET
+from BinaryFormat import map_arrays, read_binary_header, write_binary_file
+from Smoothing import AddKSmoothing, describe_smoothing, make_smoothing
+from SparseNgramTable import SparseNgramTable
+
+# Shared by all the stages of the model: training, scoring and sampling
+ENCODER = AlphabetEncoder(ALPHABET)
+
+# Orders of the n-grams a model can use. Up to DENSE_MAX_ORDER, the tables hold
+# every possible n-gram. Beyond, only the n-grams seen are stored (cf. SparseNgramTable).
+MIN_ORDER = 2
+MAX_ORDER = 7
+DENSE_MAX_ORDER = 4
+
+# Binary model file: MODEL_MAGIC, then the header and arrays as laid out by BinaryFormat.
+# Version 1 (trigrams only) has no list: context totals (float64, n x n),
+# probabilities and log-probabilities (float32, n x n x n).
+MODEL_MAGIC = b"CHARLM"
+MODEL_VERSION = 2
+MODEL_EXTENSION = "__language_model.bin"
+
+# The tables used to score texts, only ever replaced as a whole (cf. LanguageModel.set_tables()):
+# trigrams_normalized is P(w_i | w_i-n+1 ... w_i-1), trigrams_log_normalized its log,
+# context_totals the denominator of P(w_i | w_i-n+1 ... w_i-1) for each context (w_i-n+1 ... w_i-1),
+# smoothing_total being the one of the contexts never seen.
+ScoringTables = namedtuple("ScoringTables", ["smoothing_total", "context_totals",
+                                             "trigrams_normalized", "trigrams_log_normalized"])
+
+# Number of bytes read at once when the corpus is streamed
+DEFAULT_CHUNK_SIZE = 1 << 24
 
 
 class LanguageModel:
 
-    def __init__(self, path_file):
+    def __init__(self, path_file, read_corpus=True, streaming=False, chunk_size=DEFAULT_CHUNK_SIZE, workers=1,
+                 order=3):
         """
         Creates an object that can modelize a language
         given the path to a corpus.
         :param path_file Path to the file to process.
+        :param order Number of letters of the n-grams (MIN_ORDER to MAX_ORDER).
+        :param read_corpus False to create an empty model (e.g. to load it from a file).
+        :param streaming True to count the corpus chunk by chunk instead of loading it in memory.
+        :param chunk_size Number of bytes read at once when streaming.
+        :param workers Number of processes counting the corpus (more than 1 implies streaming).
         """
+        if not MIN_ORDER <= order <= MAX_ORDER:
+            raise ValueError("Unsupported order: ", order)
         self.path_file = path_file
-        file = open(path_file, "r", encoding="utf-8")
-        self.text = "".join(file.readlines())
         self.name = os.path.basename(path_file)
+        self.order = order
+        # Dense numpy arrays, or SparseNgramTable for the high orders.
+        # Whatever the order, the tables keep their historical trigrams_* names.
+        self.dense = order <= DENSE_MAX_ORDER
+        self.text = None
+        # The cleaned text, encoded by ENCODER
+        self.codes = None
         self.vocabulary = None
+        # Raw counts of the n-grams
         self.trigrams_count = None
-        self.trigrams_normalized = None
+        # The ScoringTables, also read one by one through the properties below
+        self.tables = ScoringTables(0, None, None, None)
+        # (tables, alias probabilities, alias letters): the Walker alias tables of each context
+        # of some ScoringTables, used for sampling with dense tables (cf. sampling_tables())
+        self.alias_tables = None
+        # cf. Smoothing.py, no smoothing by default
+        self.smoothing = AddKSmoothing(0)
         self.k_smoothed = False
         self.k = 0
-        self.preprocessing_text()
-        self.generate_vocabulary()
+        if read_corpus and (streaming or workers > 1):
+            self.read_corpus_by_chunks(chunk_size, workers)
+        elif read_corpus:
+            file = open(path_file, "r", encoding="utf-8")
+            self.text = file.read()
+            file.close()
+            self.preprocessing_text()
+            self.generate_vocabulary()
+
+    @property
+    def smoothing_total(self):
+        return self.tables.smoothing_total
+
+    @smoothing_total.setter
+    def smoothing_total(self, smoothing_total):
+        self.tables = self.tables._replace(smoothing_total=smoothing_total)
+
+    @property
+    def context_totals(self):
+        return self.tables.context_totals
+
+    @context_totals.setter
+    def context_totals(self, context_totals):
+        self.tables = self.tables._replace(context_totals=context_totals)
+
+    @property
+    def trigrams_normalized(self):
+        return self.tables.trigrams_normalized
+
+    @trigrams_normalized.setter
+    def trigrams_normalized(self, trigrams_normalized):
+        self.tables = self.tables._replace(trigrams_normalized=trigrams_normalized)
 
-        file.close()
+    @property
+    def trigrams_log_normalized(self):
+        return self.tables.trigrams_log_normalized
+
+    @trigrams_log_normalized.setter
+    def trigrams_log_normalized(self, trigrams_log_normalized):
+        self.tables = self.tables._replace(trigrams_log_normalized=trigrams_log_normalized)
+
+    @property
+    def alias_probabilities(self):
+        alias_tables = self.alias_tables
+        return alias_tables[1] if alias_tables is not None and alias_tables[0] is self.tables else None
+
+    @property
+    def alias_letters(self):
+        alias_tables = self.alias_tables
+        return alias_tables[2] if alias_tables is not None and alias_tables[0] is self.tables else None
 
     def preprocessing_text(self):
         """
         Cleans the text without modifying the input file.
         The function transforms all non-char characters
-        to double underscores.
+        to double underscores. The text is kept encoded only.
         """
         print(' >>> Cleaning text...', end='', flush=True)
-        self.text = regexp.sub(" ", "__", self.text.lower(), flags=regexp.MULTILINE)
-        self.text = "_" + regexp.sub("[^_a-z]", "", self.text, flags=regexp.MULTILINE) + "_"
+        self.codes = ENCODER.encode(self.text, boundaries=True)
+        self.text = None
+        print(ANSI.ok_green, 'OK !', ANSI.endc)
+
+    def read_corpus_by_chunks(self, chunk_size=DEFAULT_CHUNK_SIZE, workers=1):
+        """
+        Counts the letters and the n-grams of the corpus chunk by chunk,
+        so that the memory used does not depend on the size of the corpus.
+        With several workers, each process counts its own byte range of the corpus.
+        The text is never kept: generate_trigrams_counts() has nothing left to do.
+        :param chunk_size: Number of bytes read at once.
+        :param workers: Number of processes counting the corpus.
+        """
+        print(' >>> Counting letters and n-grams by chunks...', end='', flush=True)
+        offsets = _shard_offsets(self.path_file, workers)
+        nb_shards = len(offsets) - 1
+        if nb_shards > 1:
+            with ProcessPoolExecutor(max_workers=nb_shards) as executor:
+                shards = list(executor.map(_count_shard, [self.path_file] * nb_shards, offsets[:-1], offsets[1:],
+                                           [chunk_size] * nb_shards, [self.order] * nb_shards))
+        else:
+            shards = [_count_shard(self.path_file, offsets[0], offsets[-1], chunk_size, self.order)]
+
+        # The text starts and ends with '_', cf. preprocess_text
+        underscore = ENCODER.encode("_")
+        underscore_counts = _count_codes(underscore, self.order)
+        letters_count, self.trigrams_count, _, _ = _join_counts([underscore_counts] + shards + [underscore_counts],
+                                                                self.order)
+        self.vocabulary = {ALPHABET[i]: int(count) for i, count in enumerate(letters_count) if count > 0}
         print(ANSI.ok_green, 'OK !', ANSI.endc)
 
     def export(self):
@@ -46,92 +172,321 @@ class LanguageModel:
         Exports the current state of the model in a file.
         """
         if self.trigrams_normalized is not None:
-            with open(self.path_file + "__language_model.json", 'w') as file:
-                json.dump(self.trigrams_normalized, file, indent=4)
+            path = self.path_file + MODEL_EXTENSION
+            self.save(path)
             print(ANSI.bold, ">>> Language model successfully generated.", ANSI.endc)
-            print("     Path to language model: ", ANSI.ok_green, self.path_file + "__language_model.json", ANSI.endc)
+            print("     Path to language model: ", ANSI.ok_green, path, ANSI.endc)
+
+    def save(self, path):
+        """
+        Saves the language model in the binary model format.
+        :param path: Path to the model file.
+        """
+        tables = self.tables
+        if self.dense:
+            arrays = [("context_totals", "<f8", tables.context_totals),
+                      ("trigrams_normalized", "<f4", tables.trigrams_normalized),
+                      ("trigrams_log_normalized", "<f4", tables.trigrams_log_normalized)]
+        else:
+            arrays = [("context_keys", "<i8", tables.context_totals.keys),
+                      ("context_totals", "<f8", tables.context_totals.values),
+                      ("ngram_keys", "<i8", tables.trigrams_normalized.keys),
+                      ("trigrams_normalized", "<f4", tables.trigrams_normalized.values),
+                      ("trigrams_log_normalized", "<f4", tables.trigrams_log_normalized.values)]
+        header = {
+            "name": self.name,
+            "alphabet": ALPHABET,
+            "order": self.order,
+            "dense": self.dense,
+            "k": self.k,
+            "k_smoothed": self.k_smoothed,
+            "smoothing": describe_smoothing(self.smoothing),
+            "smoothing_total": float(tables.smoothing_total),
+            "vocabulary": {letter: int(count) for letter, count in self.vocabulary.items()}
+        }
+        write_binary_file(path, MODEL_MAGIC, MODEL_VERSION, header, arrays)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a language model exported by export()/save(), without retraining it.
+        The tables are memory-mapped, hence only read when used.
+        Models exported in the former JSON format are also accepted.
+        :param path: Path to the model file.
+        :return: The language model, ready to score texts.
+        """
+        if path.endswith(".json"):
+            return cls.load_json(path)
+
+        version, header, offset = read_binary_header(path, MODEL_MAGIC, "language model")
+        if version not in (1, MODEL_VERSION):
+            raise ValueError("Unsupported language model version: ", version)
+        if header["alphabet"] != ALPHABET:
+            raise ValueError("Unsupported alphabet: ", header["alphabet"])
+
+        n = len(ALPHABET)
+        if version == 1:
+            header["arrays"] = [["context_totals", "<f8", [n, n]],
+                                ["trigrams_normalized", "<f4", [n, n, n]],
+                                ["trigrams_log_normalized", "<f4", [n, n, n]]]
+        lm = cls(path[:-len(MODEL_EXTENSION)] if path.endswith(MODEL_EXTENSION) else path, read_corpus=False,
+                 order=header.get("order", 3))
+        lm.name = header["name"]
+        lm.dense = header.get("dense", True)
+        lm.k = header["k"]
+        lm.k_smoothed = header["k_smoothed"]
+        lm.smoothing = make_smoothing(header.get("smoothing", {"name": AddKSmoothing.name, "k": lm.k}))
+        lm.smoothing_total = header.get("smoothing_total", 0)
+        lm.vocabulary = header["vocabulary"]
+
+        arrays = map_arrays(path, header["arrays"], offset, aligned=version > 1)
+        if lm.dense:
+            lm.context_totals = arrays["context_totals"]
+            lm.trigrams_normalized = arrays["trigrams_normalized"]
+            lm.trigrams_log_normalized = arrays["trigrams_log_normalized"]
+        else:
+            lm.context_totals = SparseNgramTable(arrays["context_keys"], arrays["context_totals"])
+            lm.trigrams_normalized = SparseNgramTable(arrays["ngram_keys"], arrays["trigrams_normalized"])
+            lm.trigrams_log_normalized = SparseNgramTable(arrays["ngram_keys"], arrays["trigrams_log_normalized"])
+        return lm
+
+    @classmethod
+    def load_json(cls, path):
+        """
+        Loads a language model exported in the former JSON format
+        (probabilities only).
+        :param path: Path to the JSON file.
+        :return: The language model, ready to score texts.
+        """
+        with open(path) as file:
+            trigrams_normalized = json.load(file)
+        lm = cls(path[:-len("__language_model.json")], read_corpus=False)
+        lm.vocabulary = {}
+        lm.trigrams_normalized = lm.generate_all_trigrams()
+        for i, first_letter in enumerate(ALPHABET):
+            for j, second_letter in enumerate(ALPHABET):
+                following_letters = trigrams_normalized[first_letter + second_letter]
+                for k, third_letter in enumerate(ALPHABET):
+                    lm.trigrams_normalized[i, j, k] = following_letters[third_letter]
+        with np.errstate(divide='ignore'):
+            lm.trigrams_log_normalized = np.log(lm.trigrams_normalized)
+        return lm
 
     def generate_vocabulary(self):
         """
         Generates the vocabulary of the text.
         """
         print(' >>> Generating vocabulary...', end='', flush=True)
-        self.vocabulary = {}
-        for letter in self.text:
-            if letter in self.vocabulary.keys():
-                self.vocabulary[letter] += 1
-            else:
-                self.vocabulary[letter] = 1
+        letters_count = ENCODER.count(self.codes)
+        self.vocabulary = {ALPHABET[i]: int(count) for i, count in enumerate(letters_count) if count > 0}
         print(ANSI.ok_green, 'OK !', ANSI.endc)
 
     def generate_trigrams_counts(self):
         """
-        Counts all letter 3-grams
+        Counts all letter n-grams (3-grams by default)
         """
-        print(' >>> Generating trigram counts...', end='', flush=True)
-        # We create a 2D matrix : column = P(w_i | w_i-2, w_i-1)
-        self.trigrams_count = self.generate_all_trigrams()
-        start, end, i = 0, 2, 2
-
-        while i < len(self.text):
-            preceding_bigram = self.text[start:end]
-            current_letter = self.text[i]
+        if self.codes is None:
+            # The corpus has been streamed, the n-grams are already counted.
+            return
+        print(' >>> Generating n-gram counts...', end='', flush=True)
+        self.trigrams_count = self.count_ngrams(self.codes, self.order)
+        print(ANSI.ok_green, 'OK !', ANSI.endc)
 
-            self.trigrams_count[preceding_bigram][current_letter] += 1
+    def generate_context_totals(self):
+        """
+        Computes, once for each context, the denominator
+        used to normalise the counts of the n-grams starting with that context.
+        The model itself is left unchanged, cf. set_tables().
+        :return: the total of the contexts never seen, and the matrix (or the SparseNgramTable) of the totals.
+        """
+        n = len(ALPHABET)
+        # k is added to the count of each n-gram, but the denominator
+        # also accounts for k on each letter of the alphabet and of the vocabulary.
+        smoothing_total = self.k * (2 * n + len(self.vocabulary)) if self.k_smoothed else 0
+        if self.dense:
+            context_totals = self.trigrams_count.sum(axis=-1, dtype=np.float64) + smoothing_total
+        else:
+            totals = self.trigrams_count.sum_by_context(n)
+            context_totals = SparseNgramTable(totals.keys, totals.values + smoothing_total)
+        return smoothing_total, context_totals
 
-            start += 1
-            end += 1
-            i += 1
-        print(ANSI.ok_green, 'OK !', ANSI.endc)
+    def set_tables(self, tables):
+        """
+        Replaces the tables used to score texts, all at once: they are held by
+        a single ScoringTables, which probabilities() reads once per call.
+        The alias tables of the former ones are no longer used.
+        :param tables: (smoothing_total, context_totals, trigrams_normalized, trigrams_log_normalized)
+        """
+        self.tables = ScoringTables(*tables)
 
     def maximum_likelihood(self):
         """
-        Transform the matrix to a language model.
+        Transform the matrix to a language model, according to its smoothing.
         """
-        print(' >>> Generating trigram probabilities...', end='', flush=True)
-        self.trigrams_normalized = self.generate_all_trigrams()
-        v = len(self.vocabulary)
-        for bigram, following_bigram in self.trigrams_count.items():
-            for letter, count in following_bigram.items():
-                if self.k_smoothed:
-                    denominator = sum([cpt + self.k for key, cpt in following_bigram.items()])
-                    probability = following_bigram[letter] / (denominator + (self.k * v))
-                else:
-                    denominator = sum([cpt for k, cpt in following_bigram.items()])
-                    probability = following_bigram[letter] / denominator
-
-                self.trigrams_normalized[bigram][letter] = probability
+        print(' >>> Generating n-gram probabilities...', end='', flush=True)
+        self.set_tables(self.smoothing.normalize(self))
         print(ANSI.ok_green, 'OK !', ANSI.endc)
 
     def add_k_smoothing(self, k=1):
         """
         Smoothes de language model by adding k to each counts.
+        The raw counts are kept, k is added when normalising them.
         :param k: Amount to add to each count.
         """
-        for letter, preceding_bigrams in self.trigrams_count.items():
-            for preceding_bigram, count in preceding_bigrams.items():
-                preceding_bigrams[preceding_bigram] += k
-        self.k_smoothed = True
-        self.k = k
+        self.set_smoothing(AddKSmoothing(k))
+
+    def set_smoothing(self, smoothing):
+        """
+        Chooses how the counts are smoothed by maximum_likelihood(),
+        cf. AddKSmoothing, JelinekMercerSmoothing and KneserNeySmoothing.
+        :param smoothing: the smoothing to use.
+        """
+        self.smoothing = smoothing
+        self.context_totals = None
+        self.k_smoothed = isinstance(smoothing, AddKSmoothing)
+        self.k = smoothing.k if self.k_smoothed else 0
+
+    def update(self, text):
+        """
+        Adds a new text (e.g. the new labelled text of the day) to the counts of the model,
+        without reading the corpus again. If the model is already normalised, only the
+        contexts of the new n-grams are normalised again with add-k smoothing (the other
+        smoothings, or a new letter in the vocabulary, change every context).
+        All the new tables are built aside, then replace the current ones
+        all at once (cf. set_tables()), so that the model can keep
+        scoring texts with its former tables during the update.
+        :param text: the text to add
+        """
+        if self.trigrams_count is None:
+            raise ValueError("The raw counts are needed to update the model: ", self.name)
+        print(' >>> Updating n-gram counts...', end='', flush=True)
+        codes = ENCODER.encode(text, boundaries=True)
+        vocabulary = dict(self.vocabulary)
+        for i, count in enumerate(ENCODER.count(codes)):
+            if count > 0:
+                vocabulary[ALPHABET[i]] = vocabulary.get(ALPHABET[i], 0) + int(count)
+        new_letters = len(vocabulary) != len(self.vocabulary)
+        self.trigrams_count = merge_counts([self.trigrams_count, self.count_ngrams(codes, self.order)])
+        self.vocabulary = vocabulary
+        # The text counted so far now lives in the counts only (as when streaming).
+        self.codes = None
 
-    def generate_random_output(self, length=300, export_to_file=False):
+        if self.trigrams_normalized is not None:
+            if isinstance(self.smoothing, AddKSmoothing) and not (new_letters and self.k_smoothed):
+                self.set_tables(self._normalize_contexts(np.unique(ngram_ids(codes, self.order) // len(ALPHABET))))
+            else:
+                self.set_tables(self.smoothing.normalize(self))
+        print(ANSI.ok_green, 'OK !', ANSI.endc)
+
+    def _normalize_contexts(self, contexts):
+        """
+        Normalises again (with add-k smoothing) the n-grams of some contexts only,
+        in copies of the current tables.
+        :param contexts: the identifiers of the contexts to normalise, sorted
+        :return: the new tables, cf. set_tables()
+        """
+        n = len(ALPHABET)
+        k = np.float64(self.k)
+        tables = self.tables
+        if self.dense:
+            rows = self.trigrams_count.reshape((-1, n))[contexts].astype(np.float64)
+            totals = rows.sum(axis=-1) + tables.smoothing_total
+            rows = np.divide(rows + k, totals[:, np.newaxis], out=np.zeros(rows.shape),
+                             where=totals[:, np.newaxis] > 0)
+            context_totals = tables.context_totals.copy()
+            context_totals.reshape(-1)[contexts] = totals
+            normalized = tables.trigrams_normalized.copy()
+            normalized.reshape((-1, n))[contexts] = rows
+            log_normalized = tables.trigrams_log_normalized.copy()
+            with np.errstate(divide='ignore'):
+                log_normalized.reshape((-1, n))[contexts] = np.log(rows)
+        else:
+            keys = self.trigrams_count.keys
+            touched = np.isin(keys // n, contexts)
+            totals = SparseNgramTable(keys[touched], self.trigrams_count.values[touched]).sum_by_context(n)
+            totals.values += tables.smoothing_total
+            kept = ~np.isin(tables.context_totals.keys, totals.keys)
+            context_keys = np.concatenate([tables.context_totals.keys[kept], totals.keys])
+            context_values = np.concatenate([tables.context_totals.values[kept], totals.values])
+            positions = np.argsort(context_keys, kind="stable")
+            context_totals = SparseNgramTable(context_keys[positions], context_values[positions])
+            # The n-grams of the other contexts were all seen before, with the same probabilities.
+            probabilities, _ = tables.trigrams_normalized.lookup(keys)
+            touched_totals, _ = totals.lookup(keys[touched] // n)
+            probabilities[touched] = (self.trigrams_count.values[touched] + k) / touched_totals
+            normalized = SparseNgramTable(keys, probabilities)
+            log_normalized = SparseNgramTable(keys, np.log(probabilities))
+        return tables.smoothing_total, context_totals, normalized, log_normalized
+
+    def tune_k(self, heldout_text, grid):
+        """
+        Finds the k of add-k smoothing giving the lowest perplexity on a held-out text,
+        without normalising the counts again for each k.
+        As P = (c + k) / (T + k * s), with c the count of the n-gram and T the total of its context,
+        the log-likelihood of the held-out text only depends on the histogram of its (c, T) pairs,
+        which is computed once from the raw counts and then evaluated for the whole grid at once.
+        :param heldout_text: the held-out text (not used for training)
+        :param grid: the values of k to try
+        :return: the best k and the held-out perplexity of each k of the grid.
+        """
+        print(' >>> Tuning k...', end='', flush=True)
+        codes = ENCODER.encode(heldout_text, boundaries=True)
+        ids = ngram_ids(codes, self.order)
+        if self.dense:
+            ngram_counts = self.trigrams_count.reshape(-1)[ids]
+            context_totals = self.trigrams_count.sum(axis=-1, dtype=np.float64).reshape(-1)[ids // len(ALPHABET)]
+        else:
+            ngram_counts, _ = self.trigrams_count.lookup(ids)
+            context_totals, _ = self.trigrams_count.sum_by_context(len(ALPHABET)).lookup(ids // len(ALPHABET))
+        pairs, multiplicities = np.unique(np.stack([ngram_counts, context_totals]).astype(np.float64),
+                                          axis=1, return_counts=True)
+
+        # Same denominator as generate_context_totals(): k * (2n + v) is added to each context total.
+        ks = np.asarray(grid, dtype=np.float64)[:, np.newaxis]
+        numerators = pairs[0] + ks
+        denominators = pairs[1] + ks * (2 * len(ALPHABET) + len(self.vocabulary))
+        probabilities = np.divide(numerators, denominators, out=np.zeros(numerators.shape), where=denominators > 0)
+        with np.errstate(divide='ignore'):
+            log_likelihoods = np.log(probabilities) @ multiplicities
+        perplexities = np.exp(-log_likelihoods / len(codes))
+        print(ANSI.ok_green, 'OK !', ANSI.endc)
+        return float(ks[perplexities.argmin(), 0]), perplexities
+
+    def probabilities(self, ngram_ids, log=False, tables=None):
+        """
+        Gives P(w_i | w_i-n+1 ... w_i-1) of several n-grams at once.
+        :param ngram_ids: the identifiers of the n-grams (cf. ngram_ids())
+        :param log: True to get the log-probabilities.
+        :param tables: the ScoringTables to use, the current ones by default.
+        :return: the array of the (log-)probabilities.
+        """
+        # The tables are read once, so that they all come from the same normalisation.
+        if tables is None:
+            tables = self.tables
+        table = tables.trigrams_log_normalized if log else tables.trigrams_normalized
+        if self.dense:
+            return table.reshape(-1)[ngram_ids]
+
+        values, seen = table.lookup(ngram_ids)
+        if not seen.all():
+            # An n-gram never seen has a probability of k / (denominator of its context)
+            totals, _ = tables.context_totals.lookup(ngram_ids[~seen] // len(ALPHABET), tables.smoothing_total)
+            unseen = np.divide(np.float64(self.k), totals, out=np.zeros(len(totals)), where=totals > 0)
+            if log:
+                with np.errstate(divide='ignore'):
+                    unseen = np.log(unseen)
+            values[~seen] = unseen
+        return values
+
+    def generate_random_output(self, length=300, export_to_file=False, seed=None):
         """
         Generates a random output according
         to the generated language model.
         :param export_to_file: True if you want to export the result into a file.
         :param length: Length k (3 < k < 300), according to its probabilistic model
+        :param seed: Seed of the random generator, for reproducible outputs.
         """
-        # Step 1. We choose a random trigram starting with one or two underscores.
-        w = random.choice([w for w in self.trigrams_normalized.keys() if w.startswith('_')])
-        text = w
-        for i in range(length):
-            # Step 2. for a given length k, now choose
-            #         a random bigram (w, x) according to its probability
-            current_bigram = self.trigrams_normalized[w]
-            possible_letters = [(k, v) for k, v in current_bigram.items()]
-            text += self.generate_random_from(possible_letters)
-            w = text[-2:]
-            # And so on, until the string reaches the desired length
+        text = self.generate_random_samples(1, length, seed)[0]
 
         # text = text.replace("__", " ").replace("_", "")
         print(ANSI.bold, ">>> Random output for the language model:", ANSI.endc)
@@ -145,65 +500,174 @@ class LanguageModel:
 
         return text
 
-    def get_perplexity_from(self, text):
+    def generate_random_samples(self, nb_samples, length=300, seed=None):
+        """
+        Generates several random outputs at once, all the samples
+        being extended by one letter at each step.
+        With dense tables, each letter is drawn in O(1) thanks to the alias tables.
+        :param nb_samples: Number of outputs to generate.
+        :param length: Number of letters generated after the first bigram of each output.
+        :param seed: Seed of the random generator, for reproducible outputs.
+        :return: The list of the generated outputs.
+        """
+        tables = self.tables
+        n = len(ALPHABET)
+        nb_contexts = n ** (self.order - 1)
+        generator = np.random.default_rng(seed)
+
+        # The outputs are preceded by underscores, so that
+        # the first letters have a full context whatever the order.
+        padding = max(self.order - 3, 0)
+        codes = np.empty((nb_samples, padding + length + 2), dtype=np.uint8)
+        # Step 1. We choose a random bigram starting with an underscore.
+        codes[:, :padding + 1] = ALPHABET.index("_")
+        codes[:, padding + 1] = generator.integers(n, size=nb_samples)
+        contexts = np.zeros(nb_samples, dtype=np.int64)
+        for i in range(padding + 3 - self.order, padding + 2):
+            contexts = contexts * n + codes[:, i]
+        # Step 2. for a given length k, now choose
+        #         a random letter x following each context w according to P(x | w)
+        uniforms = generator.random((length, nb_samples))
+        for i in range(padding + 2, padding + 2 + length):
+            codes[:, i] = self.draw_letters(contexts, uniforms[i - padding - 2], tables)
+            contexts = (contexts * n + codes[:, i]) % nb_contexts
+            # And so on, until the string reaches the desired length
+
+        return [ENCODER.decode(sample[padding:]) for sample in codes]
+
+    def draw_letters(self, contexts, uniforms, tables=None):
+        """
+        Draws one letter following each context, according to P(x | context).
+        The probabilities of a context do not sum to 1 when smoothed,
+        the letters are then drawn proportionally to them.
+        A context without any probability draws its letters uniformly.
+        :param contexts: the identifiers of the contexts
+        :param uniforms: one random number in [0, 1) for each context
+        :param tables: the ScoringTables to draw from, the current ones by default.
+        :return: the codes of the letters drawn.
+        """
+        if tables is None:
+            tables = self.tables
+        n = len(ALPHABET)
+        if self.dense:
+            # A column of the alias table is picked uniformly,
+            # then either the column itself or its alias is taken.
+            alias_probabilities, alias_letters = self.sampling_tables(tables)
+            columns = (uniforms * n).astype(np.int64)
+            cells = contexts * n + columns
+            return np.where(uniforms * n - columns < alias_probabilities.reshape(-1)[cells],
+                            columns, alias_letters.reshape(-1)[cells])
+
+        # The row of each context is searched with its cumulative probabilities.
+        rows = self.probabilities((contexts[:, np.newaxis] * n + np.arange(n)).reshape(-1),
+                                  tables=tables).reshape((-1, n))
+        rows[rows.sum(axis=1) <= 0] = 1
+        cumulative = np.cumsum(rows, axis=1)
+        letters = (cumulative < (uniforms * cumulative[:, -1])[:, np.newaxis]).sum(axis=1)
+        return np.minimum(letters, n - 1)
+
+    def sampling_tables(self, tables=None):
+        """
+        Gives the alias tables of some ScoringTables (the current ones by default),
+        built by generate_alias_tables() the first time only.
+        :return: the alias probabilities and the alias letters.
+        """
+        if tables is None:
+            tables = self.tables
+        alias_tables = self.alias_tables
+        if alias_tables is None or alias_tables[0] is not tables:
+            alias_tables = self.generate_alias_tables(tables)
+        return alias_tables[1], alias_tables[2]
+
+    def generate_alias_tables(self, tables=None):
+        """
+        Builds the Walker alias table of each context, once for all (dense tables only).
+        The probabilities of a context do not sum to 1 when smoothed,
+        the letters are then drawn proportionally to them.
+        A context without any probability draws its letters uniformly.
+        :param tables: the ScoringTables whose contexts are sampled, the current ones by default.
+        :return: (tables, alias probabilities, alias letters), also kept in alias_tables.
+        """
+        if tables is None:
+            tables = self.tables
+        n = len(ALPHABET)
+        rows = tables.trigrams_normalized.reshape((-1, n))
+        alias_probabilities = np.ones(rows.shape)
+        alias_letters = np.tile(np.arange(n, dtype=np.uint8), (len(rows), 1))
+        for context, row in enumerate(rows):
+            row = np.asarray(row, dtype=np.float64)
+            total = row.sum()
+            if total <= 0:
+                continue
+            scaled = row * (n / total)
+            small = [letter for letter in range(n) if scaled[letter] < 1]
+            large = [letter for letter in range(n) if scaled[letter] >= 1]
+            while small and large:
+                less, more = small.pop(), large.pop()
+                alias_probabilities[context, less] = scaled[less]
+                alias_letters[context, less] = more
+                scaled[more] += scaled[less] - 1
+                if scaled[more] < 1:
+                    small.append(more)
+                else:
+                    large.append(more)
+        # A single assignment, the alias tables always going with their ScoringTables
+        alias_tables = (tables, alias_probabilities, alias_letters)
+        self.alias_tables = alias_tables
+        return alias_tables
+
+    def get_perplexity_from(self, text, log_space=True):
         """
         Gives the perplexity of a text regarding the current language model.
+        In log space, the log-probabilities of all the n-grams of the text
+        are gathered at once and summed, which gives the same perplexity as the
+        exact Decimal product up to a relative error of about len(text) * 1e-16
+        (1e-7 for a model loaded from a binary file, whose tables are float32).
         :param text: the text to evaluate
+        :param log_space: False to compute the perplexity with Decimal products.
         :return: The perplexity of a text according to the current language model.
         :rtype: float
         """
         # [3:] because the first chars are metadatas
-        txt = self.preprocess_text(text[3:])
+        codes = ENCODER.encode(text[3:], boundaries=True)
+        ids = ngram_ids(codes, self.order)
+        if log_space:
+            log_p = self.probabilities(ids, log=True).sum(dtype=np.float64)
+            return float(np.exp(-log_p / len(codes)))
+
         # Computation of the perplexity
-        start, end = 0, 2
-        index_current_letter = 2
         p = Decimal(1.0)
-        while index_current_letter < len(txt):
-            p *= Decimal(Decimal(1.0)/Decimal(self.trigrams_normalized[txt[start:end]][txt[index_current_letter]]))
-            start += 1
-            end += 1
-            index_current_letter += 1
+        for probability in self.probabilities(ids):
+            p *= Decimal(Decimal(1.0)/Decimal(float(probability)))
 
-        res = Decimal(p ** Decimal(1/len(txt)))
+        res = Decimal(p ** Decimal(1/len(codes)))
         return res
 
     @staticmethod
-    def generate_all_trigrams():
+    def generate_all_trigrams(dtype=np.float64, order=3):
         """
-        Generates all possible bigram
+        Generates the (empty) matrix of all possible n-grams (3-grams by default).
+        :param dtype: Type of the cells of the matrix.
+        :param order: Number of letters of the n-grams.
         """
-        z = {}
-        alphabet = "abcdefghijklmnopqrstuvwxyz_"
-        for first_letter in alphabet:
-            for second_letter in alphabet:
-                z[first_letter + second_letter] = {}
-                for third_letter in alphabet:
-                    z[first_letter + second_letter][third_letter] = 0
-        return z
+        return np.zeros((len(ALPHABET),) * order, dtype=dtype)
 
     @staticmethod
-    def generate_random_from(possible_letters):
+    def count_ngrams(codes, order=3):
         """
-        Generates a random 
-        :parameter possible_letters: The list of (letter, corresponding proba).
+        Counts all letter n-grams of an encoded text.
+        :parameter codes: the encoded text
+        :parameter order: Number of letters of the n-grams.
+        :return: the matrix : [w_i-n+1, ..., w_i] = C(w_i-n+1 ... w_i),
+                 or the SparseNgramTable of the counts beyond DENSE_MAX_ORDER.
         """
-        # As the probabilities does not sum to 1... I think, our random will not be
-        # in the range 0...1, but 0... sum{probas of the third letters for a given bigram}
-
-        # The sort here is mandatory in order to
-        # facilitate the election of the letter
-        possible_letters.sort(key=itemgetter(1), reverse=True)
-        r = random.uniform(0, sum([item[1] for item in possible_letters]))
-        cpt = 0.0
-        for item in possible_letters:
-            cpt += item[1]
-            if r < cpt:
-                return item[0]
-
-        # The following instructions should never be reachable
-        # but in case of doubt, I put them anyway.
-        print(ANSI.fail, "It seems that I could not generate a random letter", ANSI.endc)
-        return random.choice(possible_letters)[0]
+        ids = ngram_ids(codes, order)
+        if order > DENSE_MAX_ORDER:
+            return SparseNgramTable.from_ids(ids)
+        # Each n-gram is turned into its flat index in the matrix,
+        # so that the whole text is counted in a single bincount.
+        n = len(ALPHABET)
+        return np.bincount(ids, minlength=n ** order).astype(np.uint32).reshape((n,) * order)
 
     @staticmethod
     def preprocess_text(text):
@@ -211,8 +675,116 @@ class LanguageModel:
         Cleans a text.
         :parameter text: the text to clean
         """
-        text = regexp.sub(" ", "__", text.lower(), flags=regexp.MULTILINE)
-        return "_" + regexp.sub("[^_a-z]", "", text, flags=regexp.MULTILINE) + "_"
+        return ENCODER.decode(ENCODER.encode(text, boundaries=True))
+
+
+def ngram_ids(codes, order):
+    """
+    Identifies each n-gram of an encoded text by its number written in base len(ALPHABET),
+    which is also its flat index in a dense table.
+    :param codes: the encoded text
+    :param order: Number of letters of the n-grams.
+    :return: the identifiers of the len(codes) - order + 1 n-grams of the text.
+    """
+    n = len(ALPHABET)
+    nb_ngrams = max(len(codes) - order + 1, 0)
+    ids = codes[:nb_ngrams].astype(np.int32 if n ** order < 2 ** 31 else np.int64)
+    for i in range(1, order):
+        ids = ids * n + codes[i:i + nb_ngrams]
+    return ids
+
+
+def merge_counts(trigrams_counts):
+    """
+    Sums n-gram counts, e.g. of several shards or days of corpus,
+    without reading the corpora again.
+    :param trigrams_counts: the count matrices (or SparseNgramTable), cf. LanguageModel.trigrams_count
+    :return: the summed counts
+    """
+    trigrams_counts = list(trigrams_counts)
+    if any(isinstance(counts, SparseNgramTable) for counts in trigrams_counts):
+        return SparseNgramTable.merge(trigrams_counts)
+    merged = np.zeros(np.shape(trigrams_counts[0]), dtype=np.uint64)
+    for trigrams_count in trigrams_counts:
+        merged += trigrams_count
+    if merged.max(initial=0) > np.iinfo(np.uint32).max:
+        raise OverflowError("N-gram counts do not fit in 32 bits")
+    return merged.astype(np.uint32)
+
+
+def _count_codes(codes, order):
+    """
+    Counts the letters and the n-grams of an encoded text.
+    :return: (letter counts, n-gram counts, first order-1 codes, last order-1 codes)
+    """
+    return (ENCODER.count(codes), LanguageModel.count_ngrams(codes, order),
+            codes[:order - 1], codes[max(len(codes) - order + 1, 0):])
+
+
+def _join_counts(parts, order):
+    """
+    Joins the counts of consecutive parts of a text,
+    counting the n-grams which overlap two (or more) parts.
+    :param parts: the (letter counts, n-gram counts, first order-1 codes, last order-1 codes) of each part, in order.
+    :return: the (letter counts, n-gram counts, first order-1 codes, last order-1 codes) of the whole text.
+    """
+    letters_count = np.zeros(len(ALPHABET), dtype=np.int64)
+    ngrams_counts = []
+    head = tail = np.zeros(0, dtype=np.uint8)
+    for part_letters_count, part_ngrams_count, part_head, part_tail in parts:
+        letters_count += part_letters_count
+        ngrams_counts.append(part_ngrams_count)
+        # Only the n-grams starting in the previous parts are not counted yet.
+        ngrams_counts.append(LanguageModel.count_ngrams(np.concatenate([tail, part_head]), order))
+        head = np.concatenate([head, part_head])[:order - 1]
+        tail = np.concatenate([tail, part_tail])
+        tail = tail[max(len(tail) - order + 1, 0):]
+    return letters_count, merge_counts(ngrams_counts), head, tail
+
+
+def _shard_offsets(path_file, nb_shards):
+    """
+    Splits a UTF-8 file in byte ranges of about the same size,
+    each range starting at the beginning of a character.
+    :return: the list of the offsets, from 0 to the size of the file.
+    """
+    size = os.path.getsize(path_file)
+    offsets = [0]
+    with open(path_file, "rb") as file:
+        for i in range(1, nb_shards):
+            file.seek(max(size * i // nb_shards, offsets[-1]))
+            # UTF-8 continuation bytes are 10xxxxxx
+            offset = file.tell()
+            byte = file.read(1)
+            while byte and byte[0] & 0xC0 == 0x80:
+                offset += 1
+                byte = file.read(1)
+            if offset < size:
+                offsets.append(offset)
+    offsets.append(size)
+    return offsets
+
+
+def _count_shard(path_file, start, end, chunk_size, order):
+    """
+    Counts the letters and the n-grams of a byte range of a corpus, chunk by chunk.
+    Runs in the worker processes.
+    :return: (letter counts, n-gram counts, first order-1 codes, last order-1 codes) of the range.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    counts = _count_codes(np.zeros(0, dtype=np.uint8), order)
+    with open(path_file, "rb") as file:
+        file.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            data = file.read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            codes = ENCODER.encode(decoder.decode(data))
+            counts = _join_counts([counts, _count_codes(codes, order)], order)
+    codes = ENCODER.encode(decoder.decode(b"", final=True))
+    return _join_counts([counts, _count_codes(codes, order)], order)
 
 
 # Just for pretty printings
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+import glob
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from LanguageModel import LanguageModel, MODEL_EXTENSION
+from SparseNgramTable import SparseNgramTable
+
+# Former JSON models, cf. LanguageModel.load_json()
+JSON_MODEL_EXTENSION = "__language_model.json"
+
+
+class ModelRegistry:
+    """
+    Indexes the exported models of a directory, and loads each one on first use only.
+    The models kept loaded fit in a memory budget: beyond it, the least recently used
+    ones are dropped (and loaded again when needed).
+    The binary models are memory-mapped read-only, so the processes using
+    the same model files (e.g. the workers of classify.py) share their pages.
+    """
+
+    def __init__(self, directory, memory_budget=None):
+        """
+        Indexes the models of a directory (nothing is loaded yet).
+        :param directory: the directory of the exported models
+        :param memory_budget: Number of bytes of tables the loaded models may use, no limit by default.
+        """
+        self.directory = directory
+        self.memory_budget = memory_budget
+        self.paths = {}
+        # The binary models win over the JSON ones of the same name.
+        for extension in [JSON_MODEL_EXTENSION, MODEL_EXTENSION]:
+            for path in sorted(glob.glob(os.path.join(glob.escape(directory), "*" + extension))):
+                self.paths[os.path.basename(path)[:-len(extension)]] = path
+        # The models loaded, from the least to the most recently used, and their sizes
+        self.models = OrderedDict()
+        self.sizes = {}
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __contains__(self, name):
+        return name in self.paths
+
+    def names(self):
+        """
+        Gives the names of all the models of the directory, loaded or not.
+        """
+        return list(self.paths)
+
+    def memory_used(self):
+        """
+        Gives the number of bytes of the tables of the models loaded.
+        """
+        return sum(self.sizes.values())
+
+    def get(self, name):
+        """
+        Gives a model, loading it if needed.
+        :param name: the name of the model (the name of its training file)
+        """
+        if name in self.models:
+            self.models.move_to_end(name)
+            return self.models[name]
+        if name not in self.paths:
+            raise KeyError("Unknown language model: ", name)
+
+        lm = LanguageModel.load(self.paths[name])
+        self.models[name] = lm
+        self.sizes[name] = model_size(lm)
+        # The model just loaded is kept, even when it does not fit in the budget on its own.
+        while self.memory_budget is not None and self.memory_used() > self.memory_budget and len(self.models) > 1:
+            evicted, _ = self.models.popitem(last=False)
+            del self.sizes[evicted]
+        return lm
+
+    def get_all(self, names=None):
+        """
+        Gives several models, all the models of the directory by default.
+        """
+        return [self.get(name) for name in (self.names() if names is None else names)]
+
+
+def model_size(lm):
+    """
+    Gives the number of bytes of the tables of a language model.
+    """
+    tables = [lm.context_totals, lm.trigrams_normalized, lm.trigrams_log_normalized,
+              lm.alias_probabilities, lm.alias_letters]
+    size = 0
+    for table in tables:
+        if isinstance(table, SparseNgramTable):
+            size += table.keys.nbytes + np.asarray(table.values).nbytes
+        elif table is not None:
+            size += np.asarray(table).nbytes
+    return size
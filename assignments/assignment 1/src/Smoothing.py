@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from AlphabetEncoder import ALPHABET
+from SparseNgramTable import SparseNgramTable
+
+
+class AddKSmoothing:
+    """
+    Adds k to the count of each n-gram (no smoothing when k = 0).
+    Works with dense and sparse tables.
+    """
+    name = "add-k"
+
+    def __init__(self, k=1):
+        """
+        :param k: Amount to add to each count.
+        """
+        self.k = k
+
+    def parameters(self):
+        return {"k": self.k}
+
+    def normalize(self, lm):
+        """
+        Computes the probability tables of a language model from its raw counts.
+        :param lm: the language model, whose k is self.k
+        :return: the tables (smoothing_total, context_totals, trigrams_normalized, trigrams_log_normalized),
+                 the language model itself is left unchanged.
+        """
+        smoothing_total, context_totals = lm.generate_context_totals()
+        if lm.dense:
+            denominator = context_totals[..., np.newaxis]
+            # Contexts never seen (without smoothing) keep a null probability.
+            normalized = np.divide(lm.trigrams_count + np.float64(self.k), denominator,
+                                   out=np.zeros(lm.trigrams_count.shape),
+                                   where=denominator > 0)
+            with np.errstate(divide='ignore'):
+                log_normalized = np.log(normalized)
+        else:
+            # Only the n-grams seen are stored, cf. LanguageModel.probabilities() for the others.
+            keys = lm.trigrams_count.keys
+            totals, _ = context_totals.lookup(keys // len(ALPHABET))
+            probabilities = (lm.trigrams_count.values + np.float64(self.k)) / totals
+            normalized = SparseNgramTable(keys, probabilities)
+            log_normalized = SparseNgramTable(keys, np.log(probabilities))
+        return smoothing_total, context_totals, normalized, log_normalized
+
+
+class JelinekMercerSmoothing:
+    """
+    Interpolates the maximum likelihood estimate of each order with the
+    smoothed estimate of the order below, down to the uniform distribution:
+    P(w | h) = lambda * P_ML(w | h) + (1 - lambda) * P(w | h without its first letter).
+    The whole table is computed at training time (dense tables only).
+    """
+    name = "jelinek-mercer"
+
+    def __init__(self, lambdas=0.8):
+        """
+        :param lambdas: Weight of the maximum likelihood estimate, either the same
+                        for all the orders or a list from the unigrams to the highest order.
+        """
+        self.lambdas = lambdas
+
+    def parameters(self):
+        return {"lambdas": self.lambdas}
+
+    def normalize(self, lm):
+        """
+        Computes the probability tables of a language model from its raw counts.
+        :param lm: the language model
+        :return: the tables, cf. AddKSmoothing.normalize()
+        """
+        counts = _dense_counts(lm, self.name)
+        lambdas = _per_order(self.lambdas, lm.order)
+        # Order 0: the uniform distribution
+        probabilities = np.full(len(ALPHABET), 1 / len(ALPHABET))
+        for order in range(1, lm.order + 1):
+            order_counts = _marginal_counts(counts, order)
+            totals = order_counts.sum(axis=-1, keepdims=True)
+            maximum_likelihood = np.divide(order_counts, totals, out=np.zeros(order_counts.shape), where=totals > 0)
+            # A context never seen relies on the order below only.
+            weights = np.where(totals > 0, lambdas[order - 1], 0)
+            probabilities = weights * maximum_likelihood + (1 - weights) * probabilities
+        return _dense_tables(counts, probabilities)
+
+
+class KneserNeySmoothing:
+    """
+    Interpolated Kneser-Ney: a discount D is taken from the count of each n-gram
+    and given to the order below, whose n-grams are counted by the number of
+    distinct letters they follow (continuation counts) instead of their occurrences.
+    The whole table is computed at training time (dense tables only).
+    """
+    name = "kneser-ney"
+
+    def __init__(self, discounts=0.75):
+        """
+        :param discounts: Discount D (0 < D <= 1), either the same for all the orders
+                          or a list from the unigrams to the highest order.
+        """
+        self.discounts = discounts
+
+    def parameters(self):
+        return {"discounts": self.discounts}
+
+    def normalize(self, lm):
+        """
+        Computes the probability tables of a language model from its raw counts.
+        :param lm: the language model
+        :return: the tables, cf. AddKSmoothing.normalize()
+        """
+        counts = _dense_counts(lm, self.name)
+        discounts = _per_order(self.discounts, lm.order)
+        # Order 0: the uniform distribution
+        probabilities = np.full(len(ALPHABET), 1 / len(ALPHABET))
+        for order in range(1, lm.order + 1):
+            if order == lm.order:
+                order_counts = counts
+            else:
+                # Continuation counts: N1+(. h w), the number of letters seen before h w
+                order_counts = (_marginal_counts(counts, order + 1) > 0).sum(axis=0, dtype=np.float64)
+            discount = discounts[order - 1]
+            totals = order_counts.sum(axis=-1, keepdims=True)
+            nb_followers = (order_counts > 0).sum(axis=-1, keepdims=True)
+            discounted = np.divide(np.maximum(order_counts - discount, 0), totals,
+                                   out=np.zeros(order_counts.shape), where=totals > 0)
+            # What has been discounted goes to the order below,
+            # as well as the whole mass of a context never seen.
+            backoff_weights = np.divide(discount * nb_followers, totals, out=np.ones(totals.shape), where=totals > 0)
+            probabilities = discounted + backoff_weights * probabilities
+        return _dense_tables(counts, probabilities)
+
+
+SMOOTHINGS = {smoothing.name: smoothing for smoothing in [AddKSmoothing, JelinekMercerSmoothing, KneserNeySmoothing]}
+
+
+def make_smoothing(description):
+    """
+    Creates a smoothing from its description, as saved with a model.
+    :param description: {"name": <name>, <parameter>: <value>, ...}
+    """
+    parameters = dict(description)
+    return SMOOTHINGS[parameters.pop("name")](**parameters)
+
+
+def describe_smoothing(smoothing):
+    """
+    Gives the description of a smoothing, as saved with a model.
+    """
+    return dict(smoothing.parameters(), name=smoothing.name)
+
+
+def _dense_counts(lm, name):
+    """
+    Gives the counts of a language model as float, provided they are dense.
+    """
+    if not lm.dense:
+        raise ValueError(name + " smoothing needs dense tables, the order is too high: ", lm.order)
+    return lm.trigrams_count.astype(np.float64)
+
+
+def _marginal_counts(counts, order):
+    """
+    Counts of the n-grams of a lower order, summed over the first letters of the higher ones.
+    """
+    return counts.sum(axis=tuple(range(counts.ndim - order)))
+
+
+def _per_order(value, order):
+    """
+    Gives a parameter for each order, from the unigrams to the highest order.
+    """
+    values = list(value) if isinstance(value, (list, tuple)) else [value] * order
+    if len(values) != order:
+        raise ValueError("Expected one value for each order: ", values)
+    return values
+
+
+def _dense_tables(counts, probabilities):
+    """
+    Gives the tables of interpolated probabilities, cf. AddKSmoothing.normalize().
+    """
+    with np.errstate(divide='ignore'):
+        log_probabilities = np.log(probabilities)
+    return 0, counts.sum(axis=-1), probabilities, log_probabilities
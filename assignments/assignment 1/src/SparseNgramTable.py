@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+
+class SparseNgramTable:
+    """
+    Values (counts, probabilities...) of the n-grams actually seen,
+    for the orders whose dense tables would be too large.
+    An n-gram is identified by its number written in base len(alphabet),
+    which is a perfect hash of the n-gram. The identifiers are kept sorted
+    so that a whole array of n-grams is looked up at once.
+    """
+
+    def __init__(self, keys, values):
+        """
+        Creates a table from its sorted identifiers and their values.
+        :param keys: the sorted identifiers of the n-grams
+        :param values: the value of each n-gram
+        """
+        self.keys = keys
+        self.values = values
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def from_ids(cls, ngram_ids):
+        """
+        Counts the n-grams of a text.
+        :param ngram_ids: the identifiers of all the n-grams of the text
+        :return: the table of the counts of each distinct n-gram.
+        """
+        keys, counts = np.unique(ngram_ids, return_counts=True)
+        return cls(keys.astype(np.int64), counts.astype(np.uint32))
+
+    @classmethod
+    def merge(cls, tables):
+        """
+        Sums the counts of several tables.
+        :param tables: the tables of counts to sum
+        :return: the table of the summed counts.
+        """
+        keys = np.concatenate([table.keys for table in tables] + [np.zeros(0, dtype=np.int64)])
+        values = np.concatenate([table.values for table in tables] + [np.zeros(0, dtype=np.uint32)])
+        merged_keys, positions = np.unique(keys, return_inverse=True)
+        merged_values = np.zeros(len(merged_keys), dtype=np.uint64)
+        np.add.at(merged_values, positions, values)
+        if merged_values.max(initial=0) > np.iinfo(np.uint32).max:
+            raise OverflowError("N-gram counts do not fit in 32 bits")
+        return cls(merged_keys, merged_values.astype(np.uint32))
+
+    def subtract(self, table):
+        """
+        Removes the counts of another table, whose n-grams must all be in this one.
+        :param table: the table of counts to remove
+        :return: the table of the remaining counts, without the n-grams left with none.
+        """
+        counts, found = self.lookup(table.keys)
+        if not found.all() or (counts < table.values).any():
+            raise ValueError("Cannot remove more n-grams than counted: ", int((table.values - counts).clip(0).sum()))
+        values = self.values.astype(np.int64)
+        values[np.searchsorted(self.keys, table.keys)] -= table.values
+        kept = values > 0
+        return SparseNgramTable(self.keys[kept], values[kept].astype(np.uint32))
+
+    def lookup(self, ngram_ids, default=0):
+        """
+        Gives the values of several n-grams at once.
+        :param ngram_ids: the identifiers of the n-grams
+        :param default: the value of the n-grams absent from the table
+        :return: the values of the n-grams, and whether each n-gram is in the table.
+        """
+        ngram_ids = np.asarray(ngram_ids)
+        if len(self.keys) == 0:
+            return np.full(ngram_ids.shape, default, dtype=np.float64), np.zeros(ngram_ids.shape, dtype=bool)
+        positions = np.minimum(np.searchsorted(self.keys, ngram_ids), len(self.keys) - 1)
+        found = self.keys[positions] == ngram_ids
+        return np.where(found, self.values[positions], default), found
+
+    def sum_by_context(self, alphabet_size):
+        """
+        Sums the values of the n-grams sharing the same context (all their letters but the last one).
+        :param alphabet_size: the number of letters of the alphabet
+        :return: the table of the sums, indexed by the identifiers of the contexts.
+        """
+        context_keys, positions = np.unique(self.keys // alphabet_size, return_inverse=True)
+        return SparseNgramTable(context_keys, np.bincount(positions, weights=self.values,
+                                                          minlength=len(context_keys)))
@@ -1,6 +1,11 @@
 # -*- coding: utf-8 -*-
 
+import os
+
 from LanguageModel import LanguageModel, ANSI
+from classification import classify_batch
+from CountSnapshot import CountSnapshot, SNAPSHOT_EXTENSION
+from ModelRegistry import ModelRegistry
 
 
 def generate_language_model(path):
@@ -15,6 +20,8 @@ def generate_language_model(path):
     lm.maximum_likelihood()
 
     lm.export()
+    # The raw counts, to smooth or merge the model later without the corpus
+    CountSnapshot.from_model(lm).save(lm.path_file + SNAPSHOT_EXTENSION)
     lm.generate_random_output(length=200, export_to_file=True)
     print("\n")
     return lm
@@ -32,28 +39,29 @@ if __name__ == '__main__':
 
     test_set = ["../test_set/test"]
 
-    # We create the LM's
+    # We create the LM's, unless they have already been exported
+    registry = ModelRegistry("../training_set")
     language_models = []
     for corpus in training_set:
-        language_models.append(generate_language_model(corpus))
+        name = os.path.basename(corpus)
+        if name in registry:
+            print(ANSI.header, "Loading the exported", name, "model", ANSI.endc)
+            language_models.append(registry.get(name))
+        else:
+            language_models.append(generate_language_model(corpus))
 
     # We classify the test set
     for test in test_set:
         file = open(test, 'r')
-        perplexities = {}
-        i = 0
-        for line in file.readlines():
-            perplexities['line ' + str(i)] = {}
+        lines = file.readlines()
+        file.close()
+        perplexities, best_models = classify_batch(lines, language_models)
+        for line, line_perplexities, best_model in zip(lines, perplexities, best_models):
             print(ANSI.ok_blue, "Line to classify (results below):")
             print(" >>>", line[:50] + '...', ANSI.endc)
             print(" >>> Results:")
             print(" -----------")
-            for lmodel in language_models:
-                perplexities['line ' + str(i)][lmodel.name] = lmodel.get_perplexity_from(line)
-                print(" >>> Perplexity of", lmodel.name, "=", perplexities['line ' + str(i)][lmodel.name])
+            for lmodel, perplexity in zip(language_models, line_perplexities):
+                print(" >>> Perplexity of", lmodel.name, "=", perplexity)
 
-            x = min(perplexities['line ' + str(i)].keys(), key=(lambda k: perplexities['line ' + str(i)][k]))
-            print(ANSI.header, '***************** Best result:', x, '******************', ANSI.endc)
-            i += 1
-
-        file.close()
+            print(ANSI.header, '***************** Best result:', best_model, '******************', ANSI.endc)
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+
+import itertools
+
+import numpy as np
+
+from LanguageModel import ALPHABET, ENCODER, ngram_ids
+
+# Number of (model, n-gram) log-probabilities gathered at once by classify_batch()
+GATHER_SIZE = 1 << 20
+
+
+def encode_lines(lines, skip=3):
+    """
+    Cleans and encodes a batch of lines at once.
+    :param lines: the lines to encode (the first chars are metadatas).
+    :param skip: the number of metadata chars at the beginning of each line.
+    :return: the codes of all the cleaned lines put end to end,
+             and the length of each cleaned line.
+    """
+    return ENCODER.encode_lines([line[skip:] for line in lines])
+
+
+def line_ngrams(codes, lengths, order):
+    """
+    Gives the n-grams of a batch of encoded lines.
+    N-grams are taken over all the lines put end to end,
+    then those overlapping two lines (starting at one of
+    the last order-1 letters of a line) are dropped.
+    :param codes: the codes of all the lines put end to end (cf. encode_lines())
+    :param lengths: the length of each line
+    :param order: Number of letters of the n-grams.
+    :return: the identifiers of the n-grams of all the lines, the number of n-grams
+             of each line, and the index of the first n-gram of each line.
+    """
+    ids = ngram_ids(codes, order)
+    ends = np.cumsum(lengths)
+    last_letters = np.concatenate([ends - i for i in range(1, order)])
+    inside_line = np.ones(len(ids), dtype=bool)
+    inside_line[last_letters[(last_letters >= 0) & (last_letters < len(ids))]] = False
+    nb_ngrams = np.maximum(lengths - order + 1, 0)
+    return ids[inside_line], nb_ngrams, np.cumsum(nb_ngrams) - nb_ngrams
+
+
+def classify_batch(lines, models, skip=3, log_tables=None):
+    """
+    Gives the perplexity of each line regarding each language model,
+    and the name of the model with the lowest perplexity for each line.
+    With dense models, the log-probabilities of all the models are gathered at once
+    from their stacked tables, GATHER_SIZE (model, n-gram) pairs at most at a time.
+    :param lines: the lines to classify
+    :param models: the (trained) language models
+    :param skip: the number of metadata chars at the beginning of each line.
+    :param log_tables: the stacked tables of the models (cf. stack_log_tables()), stacked here by default.
+    :return: the (lines x models) matrix of perplexities and the list of best models' names.
+    """
+    order = models[0].order
+    if any(lm.order != order for lm in models):
+        raise ValueError("The models must all have the same order")
+    if log_tables is None:
+        log_tables = stack_log_tables(models)
+    codes, lengths = encode_lines(lines, skip)
+    ids, nb_ngrams, first_ngrams = line_ngrams(codes, lengths, order)
+
+    # The log-probabilities of the n-grams of each model are summed line by line.
+    # The extra null log-probability at the end closes the last line of the batch (or group).
+    log_likelihoods = np.zeros((len(models), len(lines)))
+    if len(lines) > 0 and log_tables is not None:
+        # Groups of consecutive lines, so that GATHER_SIZE (model, n-gram) pairs are gathered at a time
+        group_size = max(int(GATHER_SIZE // (len(models) * max(nb_ngrams.mean(), 1))), 1)
+        for start in range(0, len(lines), group_size):
+            end = min(start + group_size, len(lines))
+            block = np.append(ids[first_ngrams[start]:first_ngrams[end - 1] + nb_ngrams[end - 1]],
+                              len(ALPHABET) ** order)
+            log_likelihoods[:, start:end] = np.add.reduceat(np.take(log_tables, block, axis=1),
+                                                            first_ngrams[start:end] - first_ngrams[start], axis=1,
+                                                            dtype=np.float64)
+        log_likelihoods[:, nb_ngrams == 0] = 0
+    elif len(lines) > 0:
+        for lm, log_likelihood in zip(models, log_likelihoods):
+            log_p = np.append(lm.probabilities(ids, log=True), 0.0)
+            log_likelihood[:] = np.add.reduceat(log_p, first_ngrams)
+        log_likelihoods[:, nb_ngrams == 0] = 0
+
+    perplexities = np.exp(-log_likelihoods / lengths).T
+    labels = [models[i].name for i in perplexities.argmin(axis=1)]
+    return perplexities, labels
+
+
+def stack_log_tables(models):
+    """
+    Stacks the log-probability tables of dense models in a single (models x n-grams) table,
+    so that the log-probabilities of several models are gathered in one indexing step.
+    Each row ends with an extra null log-probability, given to the n-grams past the end of a line.
+    :param models: the (trained) language models
+    :return: the stacked table, or None when the tables of the models are sparse.
+    """
+    if not all(lm.dense for lm in models):
+        return None
+    size = len(ALPHABET) ** models[0].order
+    log_tables = np.zeros((len(models), size + 1), dtype=np.result_type(*[lm.trigrams_log_normalized for lm in models]))
+    for log_table, lm in zip(log_tables, models):
+        log_table[:-1] = lm.trigrams_log_normalized.reshape(-1)
+    return log_tables
+
+
+def classify_early_exit(lines, models, margin=10.0, step=16, skip=3, log_tables=None):
+    """
+    Classifies lines scoring all the models together, step n-grams at a time:
+    a model whose log-likelihood falls more than margin behind the best one is dropped,
+    and a line is decided as soon as a single model is left (or at its end).
+    All the lines of the batch move forward together: each step gathers the next
+    step n-grams of all the undecided lines for all the models left at once.
+    With many models, most of them are dropped after a few dozens of letters,
+    which pays off on long lines only: on short lines, classify_batch() is faster.
+    :param lines: the lines to classify
+    :param models: the (trained) language models
+    :param margin: the log-likelihood gap beyond which a model is dropped
+    :param step: Number of n-grams scored between two prunings.
+    :param skip: the number of metadata chars at the beginning of each line.
+    :param log_tables: the stacked tables of the models (cf. stack_log_tables()), stacked here by default.
+    :return: the list of best models' names, and the number of letters read to decide each line.
+    """
+    order = models[0].order
+    if any(lm.order != order for lm in models):
+        raise ValueError("The models must all have the same order")
+    if log_tables is None:
+        log_tables = stack_log_tables(models)
+    codes, lengths = encode_lines(lines, skip)
+    ids, nb_ngrams, first_ngrams = line_ngrams(codes, lengths, order)
+
+    log_likelihoods = np.zeros((len(lines), len(models)))
+    # The models still competing for each line, and the number of n-grams read
+    alive = np.ones((len(lines), len(models)), dtype=bool)
+    read = np.zeros(len(lines), dtype=np.int64)
+    # The n-grams of all the lines, followed by the one past the end of a line (cf. stack_log_tables())
+    size = len(ALPHABET) ** order
+    ids = np.append(ids, size)
+    offsets = np.arange(step)
+    position = 0
+    active = np.flatnonzero(nb_ngrams > 0) if len(models) > 1 else np.zeros(0, dtype=np.int64)
+    while len(active) > 0:
+        # The next step n-grams of each undecided line
+        block = np.where(position + offsets < nb_ngrams[active, np.newaxis],
+                         first_ngrams[active, np.newaxis] + position + offsets, len(ids) - 1)
+        block = ids[block]
+        # The models left for at least one of these lines, scored on all of them
+        candidates = np.flatnonzero(alive[active].any(axis=0))
+        if log_tables is not None:
+            if len(candidates) == len(models):
+                log_p = np.take(log_tables, block, axis=1).sum(axis=-1)
+            else:
+                log_p = log_tables[candidates[:, np.newaxis, np.newaxis], block].sum(axis=-1)
+        else:
+            log_p = np.zeros((len(candidates),) + block.shape)
+            inside = block < size
+            for log_p_candidate, candidate in zip(log_p, candidates):
+                log_p_candidate[inside] = models[candidate].probabilities(block[inside], log=True)
+            log_p = log_p.sum(axis=-1)
+        pairs = np.ix_(active, candidates)
+        log_likelihoods[pairs] += np.where(alive[pairs], log_p.T, 0)
+        position += step
+        read[active] = np.minimum(position, nb_ngrams[active])
+
+        scores = np.where(alive[active], log_likelihoods[active], -np.inf)
+        alive[active] &= scores >= scores.max(axis=1, keepdims=True) - margin
+        active = active[(position < nb_ngrams[active]) & (alive[active].sum(axis=1) > 1)]
+
+    # The best model left, the first one left when they all have a null likelihood
+    best = np.where(alive, log_likelihoods, -np.inf).argmax(axis=1)
+    dropped = ~alive[np.arange(len(lines)), best]
+    best[dropped] = alive[dropped].argmax(axis=1)
+    labels = [models[i].name for i in best]
+    return labels, np.minimum(read + order - 1, lengths)
+
+
+def segment_document(chunks, models, window=256, hop=32):
+    """
+    Labels the parts of a long document, read chunk by chunk.
+    Every hop n-grams, the window n-grams before are given to the model with
+    the highest log-likelihood over them. The log-likelihood of a window is the
+    difference of two prefix sums of the log-probabilities, hence O(1) per window.
+    Each chunk is scored a few windows at a time, and only the last window of
+    log-probabilities is kept between two blocks, so that the memory used grows with
+    the number of models times the window, whatever the size of the chunks.
+    Consecutive decisions of the same model make a segment.
+    Positions are indexes of n-grams in the cleaned document (starting and ending with '_').
+    :param chunks: the pieces of the document, in order
+    :param models: the (trained) language models
+    :param window: Number of n-grams scored for each decision.
+    :param hop: Number of n-grams between two decisions.
+    :return: the (start, end, best model's name) of each segment, the starts but
+             the first one being the change points.
+    """
+    order = models[0].order
+    if any(lm.order != order for lm in models):
+        raise ValueError("The models must all have the same order")
+    tail = np.zeros(0, dtype=np.uint8)
+    # Log-probabilities of the last n-grams read (null probabilities apart), and the number of n-grams read
+    last_log_p = np.zeros((len(models), 0))
+    last_nulls = np.zeros((len(models), 0), dtype=bool)
+    position = 0
+    best, start = None, 0
+    # Number of n-grams scored at once
+    block_size = 4 * max(window, hop)
+    for chunk in itertools.chain(["_"], chunks, ["_"]):
+        codes = np.concatenate([tail, ENCODER.encode(chunk)])
+        tail = codes[max(len(codes) - order + 1, 0):]
+        chunk_ids = ngram_ids(codes, order)
+        for block_start in range(0, len(chunk_ids), block_size):
+            ids = chunk_ids[block_start:block_start + block_size]
+            log_p = np.array([lm.probabilities(ids, log=True) for lm in models]).reshape((len(models), len(ids)))
+            nulls = np.concatenate([last_nulls, np.isneginf(log_p)], axis=1)
+            log_p = np.concatenate([last_log_p, np.where(np.isneginf(log_p), 0, log_p)], axis=1)
+            first = position - last_log_p.shape[1]
+            position += len(ids)
+
+            # Prefix sums from the first n-gram kept, a window with a null probability has a null likelihood.
+            sums = np.concatenate([np.zeros((len(models), 1)), np.cumsum(log_p, axis=1)], axis=1)
+            null_sums = np.concatenate([np.zeros((len(models), 1), dtype=np.int64), np.cumsum(nulls, axis=1)],
+                                       axis=1)
+            ends = np.arange((position - len(ids)) // hop * hop + hop, position + 1, hop)
+            ends = ends[ends >= window] - first
+            log_likelihoods = sums[:, ends] - sums[:, ends - window]
+            log_likelihoods[null_sums[:, ends] > null_sums[:, ends - window]] = -np.inf
+            for end, model in zip(ends + first, log_likelihoods.argmax(axis=0)):
+                if best is None:
+                    best = model
+                elif model != best:
+                    yield start, int(end) - hop, models[best].name
+                    best, start = model, int(end) - hop
+
+            last_log_p = log_p[:, max(log_p.shape[1] - window, 0):]
+            last_nulls = nulls[:, max(nulls.shape[1] - window, 0):]
+
+    if position == 0:
+        return
+    if best is None:
+        # The document is shorter than a window: a single decision over it.
+        log_likelihoods = np.where(last_nulls.any(axis=1), -np.inf, last_log_p.sum(axis=1))
+        best = log_likelihoods.argmax()
+    yield start, position, models[best].name
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+"""
+Classifies a stream of lines with exported language models, without any interaction:
+
+    python classify.py MODEL [MODEL ...] [--input FILE] [--format tsv|jsonl] [--workers N] [--early-exit MARGIN]
+
+The lines are read from the input (stdin by default) batch by batch, scored by a pool
+of workers, and the results (best model, perplexity of each model) are written
+to stdout in the order of the input. Only a few batches are in memory at once.
+With --early-exit, the models falling behind are dropped while reading each line
+(cf. classify_early_exit()), and the number of letters read replaces the perplexities.
+This only pays off on long lines (paragraphs, documents): a short line is read
+to its end before the models are told apart, and is scored faster without it.
+"""
+
+import argparse
+import io
+import itertools
+import json
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from LanguageModel import LanguageModel
+from classification import classify_batch, classify_early_exit, stack_log_tables
+
+DEFAULT_BATCH_SIZE = 4096
+
+# Models of the current process, loaded once by each worker,
+# and their stacked tables (cf. stack_log_tables())
+_models = []
+_log_tables = []
+
+
+def _load_models(model_paths):
+    """
+    Loads the models (memory-mapped) in the current process.
+    :param model_paths: the paths to the exported models.
+    """
+    _models[:] = [LanguageModel.load(path) for path in model_paths]
+    _log_tables[:] = []
+
+
+def _classify(lines, skip, margin=None):
+    """
+    Classifies a batch of lines with the models of the current process.
+    """
+    if not _log_tables:
+        _log_tables.append(stack_log_tables(_models))
+    if margin is not None:
+        labels, consumed = classify_early_exit(lines, _models, margin, skip=skip, log_tables=_log_tables[0])
+        return labels, consumed.tolist()
+    perplexities, labels = classify_batch(lines, _models, skip, log_tables=_log_tables[0])
+    return labels, perplexities.tolist()
+
+
+def batches(lines, batch_size):
+    """
+    Groups a stream of lines in lists of batch_size lines.
+    """
+    lines = iter(lines)
+    batch = list(itertools.islice(lines, batch_size))
+    while batch:
+        yield batch
+        batch = list(itertools.islice(lines, batch_size))
+
+
+def classify_stream(lines, model_paths, batch_size=DEFAULT_BATCH_SIZE, workers=1, skip=3, margin=None):
+    """
+    Classifies a stream of lines, batch by batch.
+    With several workers, at most 2 batches per worker are being scored at once,
+    so that the memory used does not depend on the number of lines.
+    :param lines: the lines to classify
+    :param model_paths: the paths to the exported models.
+    :param batch_size: Number of lines scored at once.
+    :param workers: Number of processes scoring the batches.
+    :param skip: the number of metadata chars at the beginning of each line.
+    :param margin: the margin of classify_early_exit(), None to score the whole lines with all the models.
+    :return: the (best model's name, perplexity of each model) of each line, in order,
+             or the (best model's name, number of letters read) with a margin.
+    """
+    if workers <= 1:
+        _load_models(model_paths)
+        for batch in batches(lines, batch_size):
+            yield from zip(*_classify(batch, skip, margin))
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_load_models, initargs=(model_paths,)) as executor:
+        pending = deque()
+        for batch in batches(lines, batch_size):
+            pending.append(executor.submit(_classify, batch, skip, margin))
+            if len(pending) >= 2 * workers:
+                yield from zip(*pending.popleft().result())
+        while pending:
+            yield from zip(*pending.popleft().result())
+
+
+def write_results(results, names, output, output_format="tsv", early_exit=False):
+    """
+    Writes the results of classify_stream().
+    TSV: a header, then the best model and the perplexity of each model, one line each.
+    JSONL: {"label": <best model>, "perplexities": {<model>: <perplexity>, ...}} for each line.
+    With early exit, the number of letters read replaces the perplexities ({"label": ..., "letters": ...}).
+    """
+    if early_exit:
+        if output_format == "tsv":
+            output.write("label\tletters\n")
+        for label, consumed in results:
+            if output_format == "tsv":
+                output.write(label + "\t" + str(consumed) + "\n")
+            else:
+                output.write(json.dumps({"label": label, "letters": consumed}) + "\n")
+    elif output_format == "tsv":
+        output.write("\t".join(["label"] + names) + "\n")
+        for label, perplexities in results:
+            output.write("\t".join([label] + [repr(perplexity) for perplexity in perplexities]) + "\n")
+    else:
+        for label, perplexities in results:
+            output.write(json.dumps({"label": label, "perplexities": dict(zip(names, perplexities))}) + "\n")
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Classifies lines with exported language models.")
+    parser.add_argument("models", nargs="+", help="the exported models (*__language_model.bin)")
+    parser.add_argument("--input", help="the file to classify, stdin by default")
+    parser.add_argument("--format", choices=["tsv", "jsonl"], default="tsv")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--skip", type=int, default=3, help="number of metadata chars at the beginning of each line")
+    parser.add_argument("--early-exit", type=float, metavar="MARGIN",
+                        help="drop the models whose log-likelihood falls MARGIN behind the best one "
+                             "(faster on long lines only)")
+    arguments = parser.parse_args(arguments)
+
+    # Only the headers are read here, the workers load the models themselves.
+    names = [LanguageModel.load(path).name for path in arguments.models]
+    if arguments.input:
+        lines = open(arguments.input, "r", encoding="utf-8")
+    else:
+        lines = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8")
+    with lines:
+        results = classify_stream(lines, arguments.models, arguments.batch_size, arguments.workers, arguments.skip,
+                                  arguments.early_exit)
+        write_results(results, names, sys.stdout, arguments.format, arguments.early_exit is not None)
+
+
+if __name__ == '__main__':
+    main()
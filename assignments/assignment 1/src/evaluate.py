@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+"""
+Evaluates and benchmarks the dialect identification on a labelled test set:
+
+    python evaluate.py TRAINING [TRAINING ...] [--test FILE] [--order N] [--k K] [--output report.json]
+
+The label of a model is the extension of its training file (training.AU -> AU),
+the gold label of a test line is its first field (AU\\t...).
+The report gives the training and loading time of each model, then for each
+scoring backend its throughput, its accuracy and its confusion matrix, as JSON.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import numpy as np
+
+from LanguageModel import LanguageModel, MODEL_EXTENSION
+from classification import classify_batch
+
+
+def batch_backend(lines, models):
+    """
+    All the lines at once, cf. classify_batch().
+    """
+    return classify_batch(lines, models)[0]
+
+
+def log_space_backend(lines, models):
+    """
+    Line by line, in log space.
+    """
+    return np.array([[lm.get_perplexity_from(line) for lm in models] for line in lines])
+
+
+def decimal_backend(lines, models):
+    """
+    Line by line, with exact Decimal products.
+    """
+    return np.array([[float(lm.get_perplexity_from(line, log_space=False)) for lm in models] for line in lines])
+
+
+BACKENDS = {"batch": batch_backend, "log-space": log_space_backend, "decimal": decimal_backend}
+
+
+def read_labelled_lines(path):
+    """
+    Reads a test set whose lines start with their label (AU\\t...).
+    :return: the lines (labels included, cf. classify_batch()) and the gold label of each line.
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        lines = [line.rstrip("\n") for line in file if line.strip()]
+    return lines, [line.split("\t", 1)[0].strip() for line in lines]
+
+
+def model_label(lm):
+    """
+    Gives the label of a model, the extension of its training file.
+    """
+    return lm.name.rsplit(".", 1)[-1]
+
+
+def confusion_matrix(gold_labels, predicted_labels):
+    """
+    Counts the lines of each (gold label, predicted label).
+    :return: {gold label: {predicted label: number of lines}}
+    """
+    counts = Counter(zip(gold_labels, predicted_labels))
+    labels = sorted(set(gold_labels) | set(predicted_labels))
+    return {gold: {predicted: counts[gold, predicted] for predicted in labels} for gold in labels}
+
+
+def train_models(paths, directory, order=3, k=1):
+    """
+    Trains, exports and loads back a model for each training file.
+    :param directory: the directory the models are exported to
+    :return: the loaded models, and the training and loading time of each one.
+    """
+    models, timings = [], {}
+    for path in paths:
+        start = time.perf_counter()
+        lm = LanguageModel(path, order=order)
+        lm.generate_trigrams_counts()
+        lm.add_k_smoothing(k)
+        lm.maximum_likelihood()
+        train_seconds = time.perf_counter() - start
+
+        model_path = os.path.join(directory, lm.name + MODEL_EXTENSION)
+        lm.save(model_path)
+        start = time.perf_counter()
+        models.append(LanguageModel.load(model_path))
+        timings[model_label(lm)] = {"train_seconds": train_seconds, "load_seconds": time.perf_counter() - start}
+    return models, timings
+
+
+def evaluate(lines, gold_labels, models, backend):
+    """
+    Scores the lines with a backend and compares the best models with the gold labels.
+    :return: the throughput, the accuracy and the confusion matrix of the backend.
+    """
+    start = time.perf_counter()
+    perplexities = BACKENDS[backend](lines, models)
+    seconds = time.perf_counter() - start
+    predicted_labels = [model_label(models[i]) for i in np.argmin(perplexities, axis=1)]
+    nb_chars = sum(len(line) - 3 for line in lines)
+    correct = sum(gold == predicted for gold, predicted in zip(gold_labels, predicted_labels))
+    return {
+        "seconds": seconds,
+        "lines_per_second": len(lines) / seconds if seconds > 0 else None,
+        "chars_per_second": nb_chars / seconds if seconds > 0 else None,
+        "accuracy": correct / len(lines) if lines else None,
+        "confusion_matrix": confusion_matrix(gold_labels, predicted_labels)
+    }
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Evaluates and benchmarks the dialect identification.")
+    parser.add_argument("training", nargs="+", help="the training files (training.AU, ...)")
+    parser.add_argument("--test", default="../test_set/test")
+    parser.add_argument("--order", type=int, default=3)
+    parser.add_argument("--k", type=float, default=1)
+    parser.add_argument("--backends", nargs="+", choices=list(BACKENDS), default=list(BACKENDS))
+    parser.add_argument("--output", help="the JSON report, stdout by default")
+    arguments = parser.parse_args(arguments)
+
+    lines, gold_labels = read_labelled_lines(arguments.test)
+    with tempfile.TemporaryDirectory() as directory:
+        # The progress of the training goes to stderr, the report may go to stdout.
+        stdout, sys.stdout = sys.stdout, sys.stderr
+        try:
+            models, timings = train_models(arguments.training, directory, arguments.order, arguments.k)
+        finally:
+            sys.stdout = stdout
+        report = {
+            "test": arguments.test,
+            "lines": len(lines),
+            "order": arguments.order,
+            "k": arguments.k,
+            "models": timings,
+            "backends": {backend: evaluate(lines, gold_labels, models, backend) for backend in arguments.backends}
+        }
+        # The memory-mapped models are closed before their files are removed.
+        del models
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+"""
+Splits a long document in segments labelled with the best model (cf. segment_document()):
+
+    python segment.py MODEL [MODEL ...] [--input FILE] [--window N] [--hop N]
+
+The document is read from the input (stdin by default) chunk by chunk, and each segment
+is written to stdout as it ends: start, end (positions of n-grams in the cleaned document) and label.
+"""
+
+import argparse
+import io
+import sys
+
+from LanguageModel import LanguageModel
+from classification import segment_document
+
+# Number of characters read at once
+CHUNK_SIZE = 1 << 20
+
+
+def read_chunks(file, chunk_size=CHUNK_SIZE):
+    """
+    Reads a file chunk_size characters at a time.
+    """
+    chunk = file.read(chunk_size)
+    while chunk:
+        yield chunk
+        chunk = file.read(chunk_size)
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Labels the segments of a long document.")
+    parser.add_argument("models", nargs="+", help="the exported models (*__language_model.bin)")
+    parser.add_argument("--input", help="the document, stdin by default")
+    parser.add_argument("--window", type=int, default=256, help="number of n-grams scored for each decision")
+    parser.add_argument("--hop", type=int, default=32, help="number of n-grams between two decisions")
+    arguments = parser.parse_args(arguments)
+
+    models = [LanguageModel.load(path) for path in arguments.models]
+    if arguments.input:
+        document = open(arguments.input, "r", encoding="utf-8")
+    else:
+        document = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8")
+    with document:
+        sys.stdout.write("start\tend\tlabel\n")
+        for start, end, label in segment_document(read_chunks(document), models, arguments.window, arguments.hop):
+            sys.stdout.write(str(start) + "\t" + str(end) + "\t" + label + "\n")
+            sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
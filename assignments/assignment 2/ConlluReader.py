@@ -0,0 +1,44 @@
+import io
+import sys
+
+from TransitionBasedDependyParser import ConLLUToken
+
+
+def read_sentences(source):
+    """
+    Reads a CoNLL-U file one sentence at a time, so that the memory used
+    does not depend on the size of the file. Only the columns used by the parser
+    (ID, FORM, LEMMA, UPOS) are read, straight into ConLLUTokens.
+    Multiword tokens (1-2) and empty nodes (1.1) are skipped.
+    :param source: path to the file, "-" for stdin, or a text stream
+    :return: the (tokens, text) of each sentence, the text being the one of
+             the "# text =" comment, or the forms joined by spaces when there is none.
+    """
+    owned = isinstance(source, str) and source != "-"
+    if source == "-":
+        stream = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8")
+    elif owned:
+        stream = open(source, "r", encoding="utf-8")
+    else:
+        stream = source
+    try:
+        tokens, text = [], None
+        for line in stream:
+            line = line.rstrip("\r\n")
+            if not line.strip():
+                if tokens:
+                    yield tokens, text if text is not None else " ".join(token.form for token in tokens)
+                tokens, text = [], None
+            elif line.startswith("#"):
+                key, _, value = line[1:].partition("=")
+                if key.strip() == "text":
+                    text = value.strip()
+            else:
+                columns = line.split("\t", 4)
+                if columns[0].isdigit():
+                    tokens.append(ConLLUToken(int(columns[0]), columns[1], columns[2], columns[3]))
+        if tokens:
+            yield tokens, text if text is not None else " ".join(token.form for token in tokens)
+    finally:
+        if owned:
+            stream.close()
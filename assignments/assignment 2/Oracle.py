@@ -1,64 +1,150 @@
+import os
+
+# Universal POS tags (lowered), plus the tag of the root token.
+# A tag is interned as its index in this list, cf. upos_id().
+UPOS_TAGS = ["adj", "adp", "adv", "aux", "cconj", "det", "intj", "noun", "num", "part",
+             "pron", "propn", "punct", "sconj", "sym", "verb", "x", "root"]
+UPOS_IDS = {tag: i for i, tag in enumerate(UPOS_TAGS)}
+# Id of the tags out of UPOS_TAGS. No feature matches it: the other tags of
+# the features (e.g. treebank-specific ones) get their own ids in each oracle.
+UNKNOWN_UPOS = len(UPOS_TAGS)
+DET = UPOS_IDS["det"]
+VERB = UPOS_IDS["verb"]
+
+# The compiled oracles of the process, by path to their features: (mtime of the file, oracle)
+_oracles = {}
+
+
+def upos_id(upostag):
+    """
+    Interns a UPOS tag.
+    :param upostag: the tag, whatever its case
+    :return: the id of the tag
+    """
+    return UPOS_IDS.get(upostag.lower(), UNKNOWN_UPOS)
+
+
 class Oracle:
     def __init__(self):
+        """
+        Creates an instance of an oracle.
+        """
         self.reference_parse = {}
+        # Ids of the tags of the features out of UPOS_TAGS, following UNKNOWN_UPOS
+        self.other_tag_ids = {}
+        # Action of each (s1, s2) and (s1, b1) pair of tag ids, None if there is none.
+        self.s1_s2_actions = None
+        self.s1_b1_actions = None
 
     def set_reference_set(self, reference_parse):
+        """
+        set the set of features, and compiles them into the decision tables.
+        :param reference_parse: path to the file containing the features.
+        """
         file = open(reference_parse, "r")
         for line in file.readlines():
             l = line.split(",")
             config = l[:2] if len(l) == 3 else l[:1]
             action = l[-1].replace(" ", "").replace("\n", "").replace("op=", "").lower()
             self.reference_parse["".join(config)] = action
+        file.close()
+        self.compile()
+
+    def compile(self):
+        """
+        Turns the features (e.g. "s1.t=noun s2.t=det": "leftarc") into tables indexed by tag ids.
+        The tags out of UPOS_TAGS are interned here, so that they only match themselves.
+        """
+        other_tag_ids = {}
+        features = []
+        for feature, action in self.reference_parse.items():
+            tags = {}
+            for feature_part in feature.split():
+                name, tag = feature_part.split("=")
+                tag = tag.lower()
+                if tag in UPOS_IDS:
+                    tags[name] = UPOS_IDS[tag]
+                else:
+                    tags[name] = other_tag_ids.setdefault(tag, UNKNOWN_UPOS + 1 + len(other_tag_ids))
+            features.append((tags, action))
+
+        size = UNKNOWN_UPOS + 1 + len(other_tag_ids)
+        s1_s2_actions = [[None] * size for _ in range(size)]
+        s1_b1_actions = [[None] * size for _ in range(size)]
+        for tags, action in features:
+            if "s2.t" in tags:
+                s1_s2_actions[tags["s1.t"]][tags["s2.t"]] = action
+            elif "b1.t" in tags:
+                s1_b1_actions[tags["s1.t"]][tags["b1.t"]] = action
+            # The s1 features alone (i.e. s1.t=root: done) never decide a transition,
+            # the final state is detected by the parser itself.
+        self.other_tag_ids = other_tag_ids
+        self.s1_s2_actions = s1_s2_actions
+        self.s1_b1_actions = s1_b1_actions
+
+    def tag_ids(self, tokens):
+        """
+        Gives the ids of the tags of a sentence in the tables of this oracle.
+        :param tokens: the ConLLUTokens of the sentence, whose UPOS tags are already interned
+        """
+        if not self.other_tag_ids:
+            return [token.upos for token in tokens]
+        return [token.upos if token.upos != UNKNOWN_UPOS
+                else self.other_tag_ids.get(token.upostag.lower(), UNKNOWN_UPOS) for token in tokens]
 
-    def consult(self, stack, input_buffer):
-        # we check for s1+b1
+    def tag_name(self, tag_id):
+        """
+        Gives the tag of an id of this oracle, "?" for UNKNOWN_UPOS.
+        """
+        names = UPOS_TAGS + ["?"] + list(self.other_tag_ids)
+        return names[tag_id]
+
+    def consult(self, upos, stack, buffer_start):
+        """
+        Consults the oracle.
+        :param upos: the tag id of each token of the sentence, the root first (cf. tag_ids())
+        :param stack: the indexes of the tokens of the stack
+        :param buffer_start: the index of the first token of the input buffer (len(upos) once empty)
+        :return: the 'correct' choice according to the Oracle.
+        """
         action = ""
+        has_input = buffer_start < len(upos)
         if len(stack) > 0:
-            feature = "s1.t=" + stack[-1].upostag.lower() + " "
-            if len(stack) > 1 and stack[-1].upostag.lower() == 'det' and len(input_buffer) > 0:
+            s1 = upos[stack[-1]]
+            if len(stack) > 1 and s1 == DET and has_input:
                 action = "shift"
-            elif len(stack) > 1 and ((stack[-1].upostag.lower() == 'verb' and len(input_buffer) == 0)
-                                     or stack[-1].upostag.lower() != 'verb'):
+            elif len(stack) > 1 and ((s1 == VERB and not has_input) or s1 != VERB):
                 # but first, if this a verb and the previous is
                 # the root, then we shouldn't go further
-                feature += "s2.t=" + stack[-2].upostag.lower()
-                if feature in self.reference_parse:
-                    action = self.reference_parse[feature]
-                # we check for s1,b1
-                elif len(input_buffer) > 0:
-                    feature = "s1.t=" + stack[-1].upostag.lower() + " "
-                    feature += "b1.t=" + input_buffer[0].upostag.lower()
-
-                    # we check if s1,b1 exists in the reference parse
-                    if feature in self.reference_parse:
-                        action = self.reference_parse[feature]
-
-                    # did not work, we only check for s
-                    else:
-                        feature = "s1.t=" + stack[-1].upostag.lower() + " "
-
-                        if feature in self.reference_parse:
-                            action = self.reference_parse[feature]
-                        # Uuuh... ?!
-                        else:
-                            raise ValueError("Incoherrent state: ", feature)
-
-            # we check for s1,b1
-            elif len(input_buffer) > 0:
-                feature = "s1.t=" + stack[-1].upostag.lower() + " "
-                feature += "b1.t=" + input_buffer[0].upostag.lower()
+                action = self.s1_s2_actions[s1][upos[stack[-2]]]
+                if action is None:
+                    action = self.consult_s1_b1(s1, upos[buffer_start]) if has_input else ""
+            elif has_input:
+                action = self.consult_s1_b1(s1, upos[buffer_start])
+        return action
 
-                # we check if s1,b1 exists in the reference parse
-                if feature in self.reference_parse:
-                    action = self.reference_parse[feature]
+    def consult_s1_b1(self, s1, b1):
+        """
+        Consults the (s1, b1) features.
+        """
+        action = self.s1_b1_actions[s1][b1]
+        # Uuuh... ?!
+        if action is None:
+            raise ValueError("Incoherrent state: ", self.tag_name(s1), self.tag_name(b1))
+        return action
 
-                # did not work, we only check for s
-                else:
-                    feature = "s1.t=" + stack[-1].upostag.lower() + " "
 
-                    if feature in self.reference_parse:
-                        action = self.reference_parse[feature]
-                    # Uuuh... ?!
-                    else:
-                        raise ValueError("Incoherrent state: ", feature)
-        return action
+def load_oracle(reference_parse="feattemp.txt"):
+    """
+    Gives the oracle of a features file, compiled once and shared by all the parsers of the process.
+    The file is read again only when it has been modified since.
+    :param reference_parse: path to the file containing the features.
+    """
+    path = os.path.abspath(reference_parse)
+    mtime = os.stat(path).st_mtime_ns
+    cached = _oracles.get(path)
+    if cached is None or cached[0] != mtime:
+        oracle = Oracle()
+        oracle.set_reference_set(path)
+        _oracles[path] = (mtime, oracle)
+    return _oracles[path][1]
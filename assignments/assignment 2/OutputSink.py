@@ -0,0 +1,77 @@
+import gzip
+import io
+import sys
+
+# Number of characters kept in memory before they are written
+DEFAULT_FLUSH_SIZE = 1 << 16
+
+
+class OutputSink:
+    """
+    Buffered text output, kept open for a whole run (e.g. all the sentences of a corpus).
+    The target is a file, compressed with gzip (.gz) or zstd (.zst, needs the zstandard package),
+    stdout ("-"), or any text stream such as an io.StringIO.
+    """
+
+    def __init__(self, target, flush_size=DEFAULT_FLUSH_SIZE, compression=None, append=False):
+        """
+        :param target: path to the file, "-" for stdout, or a text stream
+        :param flush_size: number of characters kept in memory before they are written
+        :param compression: "gzip", "zstd" or None, guessed from the extension of the file by default
+        :param append: True to add to an existing file
+        """
+        self.flush_size = flush_size
+        self.buffer = []
+        self.buffer_size = 0
+        # Only the files opened here are closed here.
+        self.owned = isinstance(target, str) and target != "-"
+        if target == "-":
+            self.stream = sys.stdout
+        elif not self.owned:
+            self.stream = target
+        else:
+            if compression is None:
+                compression = "gzip" if target.endswith(".gz") else "zstd" if target.endswith(".zst") else None
+            mode = "at" if append else "wt"
+            if compression == "gzip":
+                self.stream = gzip.open(target, mode, encoding="utf-8")
+            elif compression == "zstd":
+                try:
+                    import zstandard
+                except ImportError:
+                    raise ValueError("zstd compression needs the zstandard package: ", target)
+                self.stream = zstandard.open(target, mode, encoding="utf-8")
+            elif compression is None:
+                self.stream = io.open(target, mode, encoding="utf-8")
+            else:
+                raise ValueError("Unknown compression: ", compression)
+
+    def write(self, text):
+        """
+        Writes a text, actually written once flush_size characters are waiting.
+        """
+        self.buffer.append(text)
+        self.buffer_size += len(text)
+        if self.buffer_size >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes all the texts waiting.
+        """
+        if self.buffer:
+            self.stream.write("".join(self.buffer))
+            self.buffer = []
+            self.buffer_size = 0
+        self.stream.flush()
+
+    def close(self):
+        self.flush()
+        if self.owned:
+            self.stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
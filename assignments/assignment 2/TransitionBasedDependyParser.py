@@ -1,31 +1,61 @@
-from Oracle import Oracle
+from Oracle import load_oracle, upos_id
+from OutputSink import OutputSink
+
+# Trace levels of the parser, cf. TransitionBasedDependencyParser.render_trace()
+TRACE_OFF = 0
+TRACE_ACTIONS = 1
+TRACE_FULL = 2
+
+# The arcs of the parser are not labelled
+DEPREL = "DEP"
+CONLLU_COLUMNS = "#1.ID\t2.FORM\t3.LEMMA\t4.UPOSTAG\t5.XPOSTAG\t6.FEATS\t7.HEAD\t8.DEPREL\t9.DEPS\t10.MISC"
 
 
 class TransitionBasedDependencyParser:
-    def __init__(self, conllu_sentence, id_sentence, sentence):
+    def __init__(self, conllu_sentence, id_sentence, sentence, oracle=None, trace_level=TRACE_OFF,
+                 output=None, trace_output=None):
+        """
+        :param conllu_sentence: the tokens of the sentence: ConLLUTokens (cf. ConlluReader)
+                                or the ordered dictionnaries of the conllu package
+        :param id_sentence: the number of the sentence
+        :param sentence: the text of the sentence
+        :param oracle: the (compiled) oracle, the shared one of feattemp.txt by default (cf. load_oracle)
+        :param trace_level: TRACE_OFF, TRACE_ACTIONS or TRACE_FULL (the configurations too)
+        :param output: the OutputSink of the parsed sentences, shared by all the sentences of a run.
+                       By default, the sentence is appended to output.txt.
+        :param trace_output: the OutputSink of the traces, conftable.txt by default.
+        """
         self.iteration = 0
-        self.input_buffer = list()
+        # The tokens of the sentence, the root first. The stack and the input buffer
+        # only hold indexes in this list: the input buffer is tokens[buffer_start:].
+        self.tokens = [ConLLUToken.create_root_token()]
         for t in conllu_sentence:
-            # t is an ordered dictionnary [("id", <val>), ("form", <val>), ("lemma", <val>), ("upostag", <val>)]
-            self.input_buffer.append(ConLLUToken(t["id"], t["form"], t["lemma"], t["upostag"]))
-
-        self.original_conllu_sentence = list(self.input_buffer)
+            if isinstance(t, ConLLUToken):
+                self.tokens.append(t)
+            else:
+                # t is an ordered dictionnary [("id", <val>), ("form", <val>), ("lemma", <val>), ("upostag", <val>)]
+                self.tokens.append(ConLLUToken(t["id"], t["form"], t["lemma"], t["upostag"]))
+        self.oracle = oracle if oracle is not None else load_oracle("feattemp.txt")
+        self.upos = self.oracle.tag_ids(self.tokens)
+        self.buffer_start = 1
         self.sentence = sentence
         self.stack = list()
-        self.dependency_relations = {}
-        self.token_id = 0
-        self.oracle = Oracle()
-        self.oracle.set_reference_set("feattemp.txt")
-        self.parse_trace = '<sentence file="input.txt" id="' + str(id_sentence) + ' text="' + sentence + '">\n'
-        self.parse_trace += "Step\tStack\tWord List\tAction\tRelationAdded\n"
+        # Id of the head of each token, by index
+        self.heads = [0] * len(self.tokens)
+        # (step, action, top of the stack, second of the stack) of each transition:
+        # a sentence of n tokens is parsed in n shifts and n arcs.
+        self.trace_level = trace_level
+        self.parse_trace = [None] * (2 * len(conllu_sentence)) if trace_level != TRACE_OFF else None
         self.id_sentence = id_sentence
+        self.output = output
+        self.trace_output = trace_output
 
     def parse(self):
         # Initial state
         # input buffer already set in the constructor
-        self.stack.append(ConLLUToken.create_root_token())
+        self.stack.append(0)
         while not self.is_done():
-            transition_operator = self.oracle.consult(self.stack, self.input_buffer)
+            transition_operator = self.oracle.consult(self.upos, self.stack, self.buffer_start)
             self.apply(transition_operator)
 
         self.export_trace()
@@ -33,42 +63,68 @@ class TransitionBasedDependencyParser:
 
     def is_done(self):
         assert len(self.stack) > 0
-        return len(self.input_buffer) == 0 and self.stack[-1].is_root()
+        return self.buffer_start == len(self.tokens) and self.tokens[self.stack[-1]].is_root()
 
     def shift(self):
         # self.add_to_trace(Action.SHIFT.name)
-        assert len(self.input_buffer) > 0
-        self.update_trace("shift", None, None)
-        element = self.input_buffer.pop(0)
-        self.stack.append(element)
+        assert self.buffer_start < len(self.tokens)
+        self.update_trace("shift")
+        self.stack.append(self.buffer_start)
+        self.buffer_start += 1
 
     def left_arc(self):
-        assert len(self.stack) > 1 and not self.stack[-2].is_root()
-        self.update_trace("leftarc", self.stack[-1], self.stack[-2])
-        head = self.stack[-1]
-        dependent = self.stack.pop(-2)
-        self.dependency_relations[dependent.id] = head.id
+        assert len(self.stack) > 1 and not self.tokens[self.stack[-2]].is_root()
+        self.update_trace("leftarc")
+        head = self.stack.pop()
+        self.heads[self.stack[-1]] = self.tokens[head].id
+        self.stack[-1] = head
 
     def right_arc(self):
         assert len(self.stack) > 1
-        self.update_trace("rightarc", self.stack[-1], self.stack[-2])
-        if self.stack[-2].is_root():
-            self.dependency_relations[self.stack[-1].id] = 0
-        else:
-            self.dependency_relations[self.stack[-1].id] = self.stack[-2].id
-        self.stack.pop()
-
-    def update_trace(self, action, head, dependent):
+        self.update_trace("rightarc")
+        dependent = self.stack.pop()
+        self.heads[dependent] = self.tokens[self.stack[-1]].id
+
+    def update_trace(self, action):
+        """
+        Records a transition (before applying it) in the trace, if any.
+        :param action: the transition
+        """
         self.iteration += 1
-        if action == "leftarc":
-            self.parse_trace += str(self.iteration) + "\t[" + ",".join(str(x) for x in self.stack) + "]\t[" + ",".join(str(x) for x in self.input_buffer)
-            self.parse_trace += "]\tLEFTARC\t(" + str(head) + "<-" + str(dependent) + ")\n"
-        elif action == "rightarc":
-            self.parse_trace += str(self.iteration) + "\t[" + ",".join(str(x) for x in self.stack) + "]\t[" + ",".join(str(x) for x in self.input_buffer)
-            self.parse_trace += "]\tRIGHTARC\t(" + str(head) + "->" + str(dependent) + ")\n"
-        elif action == "shift":
-            self.parse_trace += str(self.iteration) + "\t[" + ",".join(str(x) for x in self.stack) + "]\t[" + ",".join(str(x) for x in self.input_buffer)
-            self.parse_trace += "]\tSHIFT\n"
+        if self.trace_level != TRACE_OFF:
+            self.parse_trace[self.iteration - 1] = (self.iteration, action, self.stack[-1],
+                                                    self.stack[-2] if len(self.stack) > 1 else None)
+
+    def render_trace(self):
+        """
+        Renders the trace in the conftable.txt format. With TRACE_FULL, the configurations
+        are rebuilt by replaying the transitions recorded, only when rendering.
+        :return: the trace of the sentence, empty with TRACE_OFF.
+        """
+        if self.trace_level == TRACE_OFF:
+            return ""
+        full = self.trace_level == TRACE_FULL
+        lines = ['<sentence file="input.txt" id="' + str(self.id_sentence) + ' text="' + self.sentence + '">',
+                 "Step\tStack\tWord List\tAction\tRelationAdded" if full else "Step\tAction\tRelationAdded"]
+        stack = [0]
+        buffer_start = 1
+        for step, action, s1, s2 in self.parse_trace[:self.iteration]:
+            line = str(step)
+            if full:
+                line += "\t[" + ",".join(str(self.tokens[i]) for i in stack) + "]\t[" + ",".join(
+                    str(x) for x in self.tokens[buffer_start:]) + "]"
+            if action == "shift":
+                lines.append(line + "\tSHIFT")
+                stack.append(buffer_start)
+                buffer_start += 1
+            elif action == "leftarc":
+                lines.append(line + "\tLEFTARC\t(" + str(self.tokens[s1]) + "<-" + str(self.tokens[s2]) + ")")
+                stack[-2:] = [s1]
+            else:
+                lines.append(line + "\tRIGHTARC\t(" + str(self.tokens[s1]) + "->" + str(self.tokens[s2]) + ")")
+                stack.pop()
+        lines.append(str(self.iteration) + ("\t[root]\t[]\tDone" if full else "\tDone"))
+        return "\n".join(lines) + "\n</sentence>\n\n"
 
     def apply(self, transition_operator):
         assert transition_operator in ["shift", "leftarc", "rightarc", "done"]
@@ -81,28 +137,43 @@ class TransitionBasedDependencyParser:
             self.right_arc()
 
     def export_trace(self):
-        self.parse_trace += str(self.iteration) + "\t[root]\t[]\tDone\n</sentence>\n\n"
-        file = open("trace_sentences.txt", "a")
-        file.write(self.parse_trace)
-        file.close()
+        if self.trace_level == TRACE_OFF:
+            return
+        if self.trace_output is not None:
+            self.trace_output.write(self.render_trace())
+        else:
+            with OutputSink("conftable.txt", append=True) as trace_output:
+                trace_output.write(self.render_trace())
 
     def export_conllu(self):
-        file = open("conllu_sentences.txt", "a")
-        file.write("# sent_id = " + str(self.id_sentence) + "\n# text = " + self.sentence + "\n")
-        file.write("#1.ID\t2.FORM\t3.LEMMA\t4.UPOSTAG\t5.XPOSTAG\t6.FEATS\t7.HEAD\t8.DEPREL\n")
-        for token in self.original_conllu_sentence:
-            file.write(str(token.id) + "\t" + token.form + "\t" + token.lemma + "\t" + token.upostag
-                       + "\t_\t_\t" + str(self.dependency_relations[token.id]) + "\tDEP\n")
-        file.write("\n\n")
-        file.close()
+        if self.output is not None:
+            self.output.write(self.render_conllu())
+        else:
+            with OutputSink("output.txt", append=True) as output:
+                output.write(self.render_conllu())
+
+    def render_conllu(self):
+        """
+        Renders the parsed sentence in the CoNLL-U format (all the 10 columns).
+        """
+        lines = ["# sent_id = " + str(self.id_sentence), "# text = " + self.sentence, CONLLU_COLUMNS]
+        for token, head in zip(self.tokens[1:], self.heads[1:]):
+            lines.append("\t".join([str(token.id), token.form, token.lemma, token.upostag,
+                                    "_", "_", str(head), DEPREL, "_", "_"]))
+        return "\n".join(lines) + "\n\n"
 
 
 class ConLLUToken:
+    # No __dict__: one compact object per token
+    __slots__ = ("id", "form", "lemma", "upostag", "upos", "head", "deprel")
+
     def __init__(self, identifier, form, lemma, upostag):
         self.id = identifier
         self.form = form
         self.lemma = lemma
         self.upostag = upostag
+        # Interned tag, used by the oracle
+        self.upos = upos_id(upostag)
         self.head = "_"
         self.deprel = "_"
 
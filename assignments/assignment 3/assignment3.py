@@ -1,10 +1,10 @@
 import sys
 import json
+import math
 import numpy as np
 import os
 import random
 import re
-from decimal import Decimal
 from operator import itemgetter
 
 from constraint import *
@@ -29,6 +29,10 @@ class Parser:
         # language model
         self.bigrams = {}
         self.vocabulary = {}
+        # key: first word, value: log-probability of a second word never seen after it
+        self.backoff_log_probabilities = {}
+        # log-probability of a bigram whose first word has never been seen
+        self.unknown_log_probability = 0.0
 
         self.k = k
 
@@ -210,6 +214,7 @@ class Parser:
             lm = json.load(open(path_file))
             self.bigrams = lm["bigrams"]
             self.vocabulary = lm["vocabulary"]
+            self.generate_log_probabilities()
             print(ANSI.ok_green, 'OK !', ANSI.endc)
         else:
             print(ANSI.fail, 'NOT OK ! (', path_file, 'not found )', ANSI.endc)
@@ -267,39 +272,51 @@ class Parser:
                 # recall that [first_word][second_word][0] = count
                 #             [first_word][second_word][1] = normalized_count
                 self.bigrams[first_word][second_word][1] = probability
+        self.generate_log_probabilities()
+
+    def generate_log_probabilities(self):
+        """
+        Stores the log-probability of each bigram next to its probability
+        ([first_word][second_word][2]), and the log-probabilities of the unseen bigrams,
+        so that get_perplexity_from() only sums lookups.
+        """
+        v = len(self.vocabulary)
+        for first_word, following_word in self.bigrams.items():
+            for entry in following_word.values():
+                # The models exported before only have the <count, normalized_count> pair.
+                del entry[2:]
+                entry.append(math.log(entry[1]))
+            # If the following word has never been encountered when following the first word,
+            # its normalized count is (k / (sum(words_count | first_word) + k*v))
+            # where sum(words_count | first_word) is the number of time the second word
+            # appeared right after the first word.
+            self.backoff_log_probabilities[first_word] = math.log(
+                self.k / (self.vocabulary[first_word] + (self.k * v)))
+        # If the current gram has never been encountered in the learning process
+        # its normalized count is (k / k*v) where k is the
+        # k in add-k smoothing and v is the size of the vocabulary
+        self.unknown_log_probability = math.log(self.k / (self.k * v)) if v > 0 else 0.0
 
     def get_perplexity_from(self, text):
         """
         Gives the perplexity of a text regarding the current language model.
+        The log-probabilities of the bigrams, computed once by generate_log_probabilities(),
+        are summed instead of multiplying their inverses, which gives the same perplexity
+        as the product up to a relative error of about len(text) * 1e-16.
         :param {string} text: the text to evaluate
         :return: The perplexity of a text according to the current language model.
         :rtype: float
         """
         txt = text.split()
-        start, end = 0, 1
-        p = Decimal(1.0)
-        while end < len(txt):
-            # If the current gram has never been encountered in the learning process
-            # We compute its normalized count as (k / k*v) where k is the
-            # k in add-k smoothing and v is the size of the vocabulary
-            if txt[start] not in self.bigrams:
-                print(self.k, len(self.vocabulary))
-                probability = self.k / (self.k * len(self.vocabulary))
-                p *= Decimal(Decimal(1.0) / Decimal(probability))
-            # If the following word has never been encountered when following the first word,
-            # we compute its normalized count as (k / (sum(words_count | first_word) + k*v))
-            # where sum(words_count | first_word) is the number of time the second word
-            # appeared right after the first word.
-            elif txt[start] in self.bigrams and txt[end] not in self.bigrams[txt[start]]:
-                probability = self.k / (self.vocabulary[txt[start]] + (self.k * len(self.vocabulary)))
-                p *= Decimal(Decimal(1.0) / Decimal(probability))
-            # the bigram is present in the language model!
+        log_p = 0.0
+        for first_word, second_word in zip(txt, txt[1:]):
+            following_word = self.bigrams.get(first_word)
+            if following_word is None:
+                log_p += self.unknown_log_probability
             else:
-                p *= Decimal(Decimal(1.0) / Decimal(self.bigrams[txt[start]][txt[end]][1]))
-            start += 1
-            end += 1
-        res = Decimal(p ** Decimal(1 / len(txt)))
-        return res
+                entry = following_word.get(second_word)
+                log_p += self.backoff_log_probabilities[first_word] if entry is None else entry[2]
+        return math.exp(-log_p / len(txt))
 
     def export(self):
         """